@@ -5,6 +5,9 @@ from dataclasses import dataclass
 
 from .builder import p
 from .core import HypertextManager
+from .template import CompiledTemplate
+
+__all__ = ["HypertextManager", "CompiledTemplate", "p", "Version", "__version__"]
 
 
 @dataclass
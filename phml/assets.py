@@ -0,0 +1,122 @@
+"""Shared files for the styles and scripts of components."""
+from __future__ import annotations
+
+import os
+import re
+from hashlib import blake2b
+from pathlib import Path
+from threading import Lock
+from typing import Literal as Lit
+from uuid import uuid4
+
+from .nodes import Element, Literal, LiteralType
+
+__all__ = ["AssetBundle", "minify_css"]
+
+re_css_minify = re.compile(
+    r"""(/\*.*?(?:\*/|\Z))|("(?:\\.|[^"\\\n])*"?|'(?:\\.|[^'\\\n])*'?)|\s*([{};,])\s*|(\s+)""",
+    re.DOTALL,
+)
+
+
+def _minify(match: re.Match) -> str:
+    comment, string, punctuation, _ = match.groups()
+    if comment is not None:
+        return ""
+    if string is not None:
+        return string
+    if punctuation is not None:
+        return punctuation
+    return " "
+
+
+def minify_css(css: str) -> str:
+    """Remove the comments and extra whitespace from css. Strings are left as is."""
+    return re_css_minify.sub(_minify, css).strip()
+
+
+class AssetBundle:
+    """Writes the styles and scripts of the components used by a page to files named by a hash
+    of their content. Pages reference the files with `<link>` and `<script src>` elements instead
+    of inlining the styles and scripts, so browsers can cache them between pages and the same
+    file is only written once.
+
+    Args:
+        directory (str | Path): The directory the files are written to.
+        url (str): The url the files in the directory are served from. Defaults to `/assets/`.
+        per (str): `component` writes a style and script file for each component. `page` writes
+            one style and script file for each set of components used together by a page.
+        minify (bool): Whether to minify the styles. Defaults to True.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        url: str = "/assets/",
+        per: Lit["component", "page"] = "component",
+        minify: bool = True,
+    ) -> None:
+        if per not in ["component", "page"]:
+            raise ValueError(f"Expected per to be 'component' or 'page' but was {per!r}")
+
+        self.directory = Path(directory)
+        self.url = url if url.endswith("/") else f"{url}/"
+        self.per = per
+        self.minify = minify
+        self._written: set[str] = set()
+        self._lock = Lock()
+
+    def __getstate__(self) -> tuple:
+        return (self.directory, self.url, self.per, self.minify)
+
+    def __setstate__(self, state: tuple):
+        self.directory, self.url, self.per, self.minify = state
+        self._written = set()
+        self._lock = Lock()
+
+    def write(self, name: str, content: str, extension: str) -> str:
+        """Write content to a file named by the name and a hash of the content if it does not
+        exist yet. Returns the url of the file.
+        """
+        digest = blake2b(content.encode("utf-8"), digest_size=8).hexdigest()
+        file = f"{name.lower().replace('.', '-')}.{digest}.{extension}"
+
+        with self._lock:
+            if file not in self._written:
+                path = self.directory / file
+                if not path.is_file():
+                    self.directory.mkdir(parents=True, exist_ok=True)
+                    # Written with the default permissions, unlike temporary files which are
+                    # only readable by their owner, as the files are served
+                    temp = self.directory / f".{file}.{uuid4().hex}"
+                    descriptor = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+                    with os.fdopen(descriptor, "w", encoding="utf-8") as output:
+                        output.write(content)
+                    os.replace(temp, path)
+                self._written.add(file)
+        return f"{self.url}{file}"
+
+    def elements(self, assets: list[tuple[str, str, str]]) -> list[Element]:
+        """Write the files for the name, styles, and scripts of the used components and create
+        the elements that reference them.
+        """
+        if self.per == "page":
+            # Pages that use the same components share the files
+            assets = sorted(assets)
+
+        styles = [(name, style) for name, style, _ in assets if len(style.strip()) > 0]
+        scripts = [(name, script) for name, _, script in assets if len(script.strip()) > 0]
+        if self.per == "page":
+            styles = [("components", "\n".join(s for _, s in styles))] if styles else []
+            scripts = [("components", "\n".join(s for _, s in scripts))] if scripts else []
+
+        elements = []
+        for name, style in styles:
+            style = minify_css(style) if self.minify else style.strip()
+            href = self.write(name, style, "css")
+            elements.append(Element("link", {"rel": "stylesheet", "href": href}))
+        for name, script in scripts:
+            src = self.write(name, script.strip(), "js")
+            # Empty elements are rendered as self closing which browsers do not allow for scripts
+            elements.append(Element("script", {"src": src}, [Literal(LiteralType.Text, "")]))
+        return elements
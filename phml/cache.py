@@ -0,0 +1,175 @@
+"""Bounded caches used to avoid repeating expensive work between builds and renders."""
+from __future__ import annotations
+
+import os
+import pickle
+from collections import OrderedDict
+from hashlib import blake2b
+from pathlib import Path
+from threading import Lock
+from typing import Any, Generic, NamedTuple, TypeVar
+from uuid import uuid4
+
+from .nodes import AST
+
+__all__ = ["CacheInfo", "LRUCache", "ParseCache"]
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+    maxsize: int
+
+
+class LRUCache(Generic[K, V]):
+    """Thread safe mapping with a maximum size. When full, the least recently used
+    entry is evicted. Hits and misses are counted to help with sizing the cache.
+    """
+
+    def __init__(self, maxsize: int = 128) -> None:
+        if maxsize < 0:
+            raise ValueError(f"Cache maxsize must be >= 0 but was {maxsize}")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, V] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        """Get a value and mark it as the most recently used. Returns `default` if
+        the key is not cached.
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: K, value: V):
+        """Cache a value, evicting the least recently used value if the cache is full."""
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries and reset the hit and miss counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def info(self) -> CacheInfo:
+        """Hits, misses, current size, and max size of the cache."""
+        return CacheInfo(self.hits, self.misses, len(self._data), self.maxsize)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ParseCache:
+    """Content addressed cache of parsed ASTs. Entries are keyed by a hash of the source text
+    and the parser options.
+
+    Every hit returns a lazy copy of the cached AST that can be mutated without corrupting the
+    cache. Optionally entries are also serialized to a directory so they survive between runs.
+
+    Note:
+        The on-disk store uses `pickle`. Only point `directory` at a directory you trust.
+    """
+
+    FORMAT = 4
+    """Version of the serialized AST format. Entries of other versions are never used."""
+
+    def __init__(
+        self,
+        maxsize: int = 128,
+        directory: str | Path | None = None,
+    ) -> None:
+        self._memory: LRUCache[str, AST] = LRUCache(maxsize)
+        self.directory = Path(directory) if directory is not None else None
+
+    @classmethod
+    def key(cls, source: str, *options: Any) -> str:
+        """Create the cache key for a source string parsed with the given options."""
+        digest = blake2b(f"{cls.FORMAT}{options!r}".encode(), digest_size=20)
+        digest.update(source.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path | None:
+        if self.directory is None:
+            return None
+        return self.directory / f"{key}.ast"
+
+    def get(self, key: str) -> AST | None:
+        """Get a fresh copy of the cached AST for a key. Returns `None` on a miss. Entries loaded
+        from the directory are counted as hits.
+        """
+        if key not in self._memory and (ast := self._load(key)) is not None:
+            self._memory.set(key, ast)
+            if key not in self._memory:
+                return ast
+
+        ast = self._memory.get(key)
+        if ast is not None:
+            return ast.clone(lazy=True)
+        return None
+
+    def _load(self, key: str) -> AST | None:
+        if (path := self._path(key)) is None or not path.is_file():
+            return None
+        try:
+            return pickle.loads(path.read_bytes())
+        except Exception:
+            return None
+
+    def set(self, key: str, ast: AST):
+        """Cache an AST. The AST is copied immediately so later changes to it are not cached.
+        ASTs that can not be copied or serialized, i.e. are nested too deep, are not cached.
+        """
+        try:
+            ast = ast.clone()
+        except RecursionError:
+            return
+        self._memory.set(key, ast)
+
+        if (path := self._path(key)) is not None:
+            try:
+                data = pickle.dumps(ast, protocol=pickle.HIGHEST_PROTOCOL)
+            except (RecursionError, pickle.PicklingError):
+                return
+
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Written with the default permissions, unlike temporary files which are only
+            # readable by their owner, so the entries can be shared
+            temp = path.parent / f".{path.name}.{uuid4().hex}"
+            descriptor = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            try:
+                with os.fdopen(descriptor, "wb") as file:
+                    file.write(data)
+                os.replace(temp, path)
+            except BaseException:
+                temp.unlink(missing_ok=True)
+                raise
+
+    def clear(self):
+        """Clear the in-memory entries. The on-disk entries are kept."""
+        self._memory.clear()
+
+    @property
+    def info(self) -> CacheInfo:
+        """Hits, misses, current size, and max size of the in-memory cache."""
+        return self._memory.info
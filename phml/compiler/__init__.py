@@ -1,19 +1,34 @@
-from collections.abc import Callable
-from copy import deepcopy
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable, Iterator
+from itertools import chain, islice
 from typing import Any
 from typing import Literal as Lit
-from typing import NoReturn, overload
+from typing import TYPE_CHECKING, NamedTuple, NoReturn, overload
 
-from phml.components import ComponentManager
-from phml.embedded import Embedded
+from phml.components import ComponentManager, StaticElement
+from phml.embedded import Embedded, ImportRegistry
 from phml.helpers import normalize_indent
-from phml.nodes import AST, Element, Literal, LiteralType, Parent
+from phml.nodes import AST, Element, Literal, LiteralType, Node, Parent
 
 from .steps import *
-from .steps.base import post_step, scoped_step, setup_step
+from .steps.base import (
+    Features,
+    post_step,
+    scan_document,
+    scan_features,
+    scoped_step,
+    setup_step,
+)
+from .steps.components import PureComponent, cached_component, memoize_component
+from .steps.loops import LazyLoop, expand_lazy_loop
+
+if TYPE_CHECKING:
+    from _typeshed import SupportsWrite
 
 __all__ = [
     "HypertextMarkupCompiler",
+    "Pipeline",
     "setup_step",
     "scoped_step",
     "post_step",
@@ -60,6 +75,9 @@ def add_step(
     | Callable[[AST, ComponentManager, dict[str, Any]], None],
     stage: StepStage,
 ):
+    """Add a step to the default pipeline. Used by compilers without their own pipeline and
+    by managers created after the step is added.
+    """
     if stage == "setup":
         __SETUP__.append(step)
     elif stage == "scoped":
@@ -89,6 +107,7 @@ def remove_step(
     | Callable[[AST, ComponentManager, dict[str, Any]], None],
     stage: StepStage,
 ):
+    """Remove a step from the default pipeline."""
     if stage == "setup":
         __SETUP__.remove(step)
     elif stage == "scoped":
@@ -97,7 +116,56 @@ def remove_step(
         __POST__.remove(step)
 
 
+class Pipeline(NamedTuple):
+    """The steps a compiler runs. Pipelines are immutable, adding or removing a step returns
+    a new pipeline so a compile always runs with the steps it started with.
+    """
+
+    setup: tuple[Callable, ...] = ()
+    scoped: tuple[Callable, ...] = ()
+    post: tuple[Callable, ...] = ()
+
+    @classmethod
+    def default(cls) -> Pipeline:
+        """Pipeline of the steps added with the module level `add_step`."""
+        return cls(tuple(__SETUP__), tuple(__STEPS__), tuple(__POST__))
+
+    def _stage(self, stage: StepStage) -> tuple[Callable, ...]:
+        if stage not in ["setup", "scoped", "post"]:
+            raise ValueError(
+                f"Expected stage to be 'setup', 'scoped', or 'post' but was {stage!r}"
+            )
+        return getattr(self, stage)
+
+    def add_step(self, step: Callable, stage: StepStage) -> Pipeline:
+        """New pipeline with the step added to the end of the stage."""
+        return self._replace(**{stage: (*self._stage(stage), step)})
+
+    def remove_step(self, step: Callable, stage: StepStage) -> Pipeline:
+        """New pipeline with the step removed from the stage."""
+        steps = list(self._stage(stage))
+        steps.remove(step)
+        return self._replace(**{stage: tuple(steps)})
+
+
 class HypertextMarkupCompiler:
+    pipeline: Pipeline | None
+    """Steps used to compile. `None` uses the steps added with the module level `add_step`."""
+    imports: ImportRegistry
+    """Modules exposed to the `<python>` elements."""
+
+    def __init__(
+        self,
+        pipeline: Pipeline | None = None,
+        imports: ImportRegistry | None = None,
+    ) -> None:
+        self.pipeline = pipeline
+        self.imports = imports or ImportRegistry()
+
+    def snapshot(self) -> Pipeline:
+        """The steps the next compile runs."""
+        return self.pipeline if self.pipeline is not None else Pipeline.default()
+
     def _get_python_elements(self, node: Parent) -> list[Element]:
         result = []
         for child in node:
@@ -116,38 +184,148 @@ class HypertextMarkupCompiler:
         node: Parent,
         components: ComponentManager,
         context: dict,
+        steps: tuple[Callable, ...] | None = None,
     ):
-        """Process steps for a given scope/parent node."""
+        """Process steps for a given scope/parent node. Steps that declare the elements they
+        handle are only run when the scope has one of those elements.
+        """
+
+        if steps is None:
+            steps = self.snapshot().scoped
 
         # Core compile steps
-        for _step in __STEPS__:
+        features = None
+        for _step in steps:
+            handles = getattr(_step, "handles", None)
+            if handles is not None:
+                if features is None:
+                    features = scan_features(node)
+                if not handles.matches(features, components):
+                    continue
+
             _step(node, components, context)
+            # The step may have changed the children
+            features = None
+
+        # Recurse steps for each scope. Lazy loops are processed as they are rendered,
+        # copies of compiled pure components are already processed, and static parts of
+        # components are left as is
+        for i, child in enumerate(node):
+            if isinstance(child, LazyLoop):
+                child.steps = steps
+            elif isinstance(child, StaticElement) and self._is_static(child, components, steps):
+                continue
+            elif isinstance(child, PureComponent):
+                if child.key is not None:
+                    compiled = cached_component(child, components)
+                    if compiled is not None:
+                        node[i] = compiled
+                    else:
+                        self._process_scope_(child, components, context, steps)
+                        memoize_component(child, components)
+                        child.key = None
+            elif isinstance(child, Element):
+                self._process_scope_(child, components, context, steps)
+
+    def _is_static(
+        self,
+        node: StaticElement,
+        components: ComponentManager,
+        steps: tuple[Callable, ...],
+    ) -> bool:
+        """Whether none of the steps act on the descendants of a static component element.
+        Static elements have no embedded python so only steps declaring the elements they
+        handle can be skipped.
+        """
+        features = Features(node.tags, node.names)
+        return all(
+            _step is step_execute_embedded_python
+            or (
+                getattr(_step, "handles", None) is not None
+                and not _step.handles.matches(features, components)
+            )
+            for _step in steps
+        )
 
-        # Recurse steps for each scope
+    def _iter_children(self, node: Parent) -> Iterator[Node]:
+        """Iterate the children of a node to render them. Lazy loops are expanded one iteration
+        at a time and the compile steps that follow loop expansion are run on each iteration.
+        """
         for child in node:
-            if isinstance(child, Element):
-                self._process_scope_(child, components, context)
+            if isinstance(child, LazyLoop):
+                steps = child.steps if child.steps is not None else self.snapshot().scoped
+                following = steps
+                if step_expand_lazy_loop_tags in steps:
+                    following = steps[steps.index(step_expand_lazy_loop_tags) + 1 :]
+
+                for scope in expand_lazy_loop(child):
+                    for _step in following:
+                        _step(scope, child.components, child.compile_context)
+
+                    for new_child in scope:
+                        if isinstance(new_child, Element):
+                            self._process_scope_(
+                                new_child,
+                                child.components,
+                                child.compile_context,
+                                steps,
+                            )
+                        yield new_child
+            else:
+                yield child
 
     def compile(
-        self, node: Parent, _components: ComponentManager, **context: Any
+        self,
+        node: Parent,
+        _components: ComponentManager,
+        *,
+        _lazy_loops: bool = False,
+        **context: Any,
     ) -> Parent:
+        """Compile a copy of the node. With `_lazy_loops` the `<For>` elements without condition
+        attributes are expanded one iteration at a time as the result is rendered.
+        """
+        # The steps and imports can change while compiling so they are read once
+        pipeline = self.snapshot()
+        imports = self.imports
+        imports.bind(context)
+
+        # The components used are tracked per compile
+        _components = _components.track()
+
         # get all python elements and process them
-        node = deepcopy(node)
+        node = node.clone(lazy=True)
         p_elems = self._get_python_elements(node)
         embedded = Embedded("")
         for p_elem in p_elems:
-            embedded += Embedded(p_elem)
+            embedded += Embedded(p_elem, registry=imports)
 
         # Setup steps to collect data before comiling at different scopes
-        for step in __SETUP__:
+        for step in pipeline.setup:
             step(node, _components, context)
 
+        # Skip the steps for elements that are not in the document or the components it uses.
+        # Markdown may add any element so all steps are kept for it.
+        features = scan_document(node, _components)
+        steps = tuple(
+            step
+            for step in pipeline.scoped
+            if "Markdown" in features.tags
+            or getattr(step, "handles", None) is None
+            or step.handles.matches(features, _components)
+        )
+        if _lazy_loops:
+            steps = tuple(
+                step_expand_lazy_loop_tags if step is step_expand_loop_tags else step
+                for step in steps
+            )
+
         # Recursively process scopes
         context.update(embedded.context)
-        self._process_scope_(node, _components, context)
+        self._process_scope_(node, _components, context, steps)
 
         # Post compiling steps to finalize the ast
-        for step in __POST__:
+        for step in pipeline.post:
             step(node, _components, context)
 
         return node
@@ -158,59 +336,113 @@ class HypertextMarkupCompiler:
         else:
             return str(key) if value else f'{key}="false"'
 
-    def _render_element(
+    def _render_start_tag(
         self,
         element: Element,
         indent: int = 0,
         compress: str = "\n",
+        empty: bool | None = None,
     ) -> str:
         attr_idt = 2
         attrs = ""
-        lead_space = " " if len(element.attributes) > 0 else ""
+        # Read the attributes directly so elements without any keep sharing `EMPTY_DICT`
+        attributes = element._attributes
+        lead_space = " " if len(attributes) > 0 else ""
         if element.in_pre:
             attrs = lead_space + " ".join(
                 self._render_attribute(key, value)
-                for key, value in element.attributes.items()
+                for key, value in attributes.items()
             )
-        elif len(element.attributes) > 1:
+        elif len(attributes) > 1:
             idt = indent + attr_idt if compress == "\n" else 1
             attrs = (
                 f"{compress}"
                 + " " * (idt)
                 + f'{compress}{" "*(idt)}'.join(
                     self._render_attribute(key, value)
-                    for key, value in element.attributes.items()
+                    for key, value in attributes.items()
                 )
                 + f"{compress}{' '*(indent)}"
             )
-        elif len(element.attributes) == 1:
-            key, value = list(element.attributes.items())[0]
+        elif len(attributes) == 1:
+            key, value = list(attributes.items())[0]
             attrs = lead_space + self._render_attribute(key, value)
 
-        result = f"{' '*indent if not element.in_pre else ''}<{element.tag}{attrs}{'' if len(element) > 0 else '/'}>"
-        if len(element) == 0:
-            return result
+        if empty is None:
+            empty = len(element) == 0
+        return f"{' '*indent if not element.in_pre else ''}<{element.tag}{attrs}{'/' if empty else ''}>"
 
-        if (
+    def _is_inline(self, element: Element, head: list[Node], start: str, compress: str) -> bool:
+        """Whether the children of an element are rendered on the same line as it's tags. `head`
+        is the first two children of the element after lazy loops are expanded.
+        """
+        return (
             compress != "\n"
             or element.in_pre
             or (
                 element.tag not in ["script", "style", "python"]
-                and len(element) == 1
-                and Literal.is_text(element[0])
-                and "\n" not in element[0].content
-                and "\n" not in result
+                and len(head) == 1
+                and Literal.is_text(head[0])
+                and "\n" not in head[0].content
+                and "\n" not in start
             )
-        ):
-            children = self._render_tree_(element, _compress=compress)
-            result += children + f"</{element.tag}>"
+        )
+
+    def _head(self, element: Element) -> tuple[list[Node], Iterator[Node]]:
+        """The first two children of an element and an iterator of all its children. Lazy loops
+        can expand to any number of children, so how an element is laid out is decided by its
+        children after the first iterations of its loops are expanded.
+        """
+        children = self._iter_children(element)
+        head = list(islice(children, 2))
+        return head, chain(head, children)
+
+    def _render_element(
+        self,
+        element: Element,
+        indent: int = 0,
+        compress: str = "\n",
+    ) -> str:
+        if len(element) == 0:
+            return self._render_start_tag(element, indent, compress, True)
+
+        head, children = self._head(element)
+        result = self._render_start_tag(element, indent, compress, len(head) == 0)
+        if len(head) == 0:
+            return result
+
+        if self._is_inline(element, head, result, compress):
+            result += self._render_nodes_(children, 0, compress) + f"</{element.tag}>"
         else:
-            children = self._render_tree_(element, indent + 2, _compress=compress)
-            result += compress + children
+            result += compress + self._render_nodes_(children, indent + 2, compress)
             result += f"{compress}{' '*indent}</{element.tag}>"
 
         return result
 
+    def _iter_element(
+        self,
+        element: Element,
+        indent: int = 0,
+        compress: str = "\n",
+    ) -> Iterator[str]:
+        if len(element) == 0:
+            yield self._render_start_tag(element, indent, compress, True)
+            return
+
+        head, children = self._head(element)
+        start = self._render_start_tag(element, indent, compress, len(head) == 0)
+        yield start
+        if len(head) == 0:
+            return
+
+        if self._is_inline(element, head, start, compress):
+            yield from self._iter_nodes_(children, 0, compress)
+            yield f"</{element.tag}>"
+        else:
+            yield compress
+            yield from self._iter_nodes_(children, indent + 2, compress)
+            yield f"{compress}{' '*indent}</{element.tag}>"
+
     def _render_literal(
         self,
         literal: Literal,
@@ -252,8 +484,16 @@ class HypertextMarkupCompiler:
         indent: int = 0,
         _compress: str = "\n",
     ):
+        return self._render_nodes_(self._iter_children(node), indent, _compress)
+
+    def _render_nodes_(
+        self,
+        children: Iterable[Node],
+        indent: int = 0,
+        _compress: str = "\n",
+    ) -> str:
         result = []
-        for child in node:
+        for child in children:
             if isinstance(child, Element):
                 if child.tag == "doctype":
                     result.append("<!DOCTYPE html>")
@@ -266,6 +506,34 @@ class HypertextMarkupCompiler:
 
         return _compress.join(result)
 
+    def _iter_tree_(
+        self,
+        node: Parent,
+        indent: int = 0,
+        _compress: str = "\n",
+    ) -> Iterator[str]:
+        return self._iter_nodes_(self._iter_children(node), indent, _compress)
+
+    def _iter_nodes_(
+        self,
+        children: Iterable[Node],
+        indent: int = 0,
+        _compress: str = "\n",
+    ) -> Iterator[str]:
+        for i, child in enumerate(children):
+            if i > 0 and _compress != "":
+                yield _compress
+
+            if isinstance(child, Element):
+                if child.tag == "doctype":
+                    yield "<!DOCTYPE html>"
+                else:
+                    yield from self._iter_element(child, indent, _compress)
+            elif isinstance(child, Literal):
+                yield self._render_literal(child, indent, _compress)
+            else:
+                raise TypeError(f"Unknown renderable node type {type(child)}")
+
     def render(
         self,
         node: Parent,
@@ -273,3 +541,41 @@ class HypertextMarkupCompiler:
         indent: int = 0,
     ) -> str:
         return self._render_tree_(node, indent, "" if _compress else "\n")
+
+    def iter_render(
+        self,
+        node: Parent,
+        _compress: bool = False,
+        indent: int = 0,
+        chunk_size: int = 8192,
+    ) -> Iterator[str]:
+        """Render the node in chunks. The tree is rendered as it is iterated and the rendered html
+        is yielded once at least `chunk_size` characters are collected. Joining the chunks gives
+        the same result as `render`.
+        """
+        buffer = []
+        size = 0
+        for part in self._iter_tree_(node, indent, "" if _compress else "\n"):
+            buffer.append(part)
+            size += len(part)
+            if size >= chunk_size:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+
+        if len(buffer) > 0:
+            yield "".join(buffer)
+
+    def render_to(
+        self,
+        file: SupportsWrite[str],
+        node: Parent,
+        _compress: bool = False,
+        indent: int = 0,
+        chunk_size: int = 8192,
+    ):
+        """Render the node and write it to a file like object in chunks instead of rendering
+        the full html string first.
+        """
+        for chunk in self.iter_render(node, _compress, indent, chunk_size):
+            file.write(chunk)
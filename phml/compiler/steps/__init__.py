@@ -2,7 +2,7 @@ from .components import step_add_cached_component_elements, step_substitute_comp
 from .conditional import step_execute_conditions
 from .embedded import step_execute_embedded_python
 from .format import step_ensure_doctype
-from .loops import step_expand_loop_tags
+from .loops import step_expand_lazy_loop_tags, step_expand_loop_tags
 from .markup import step_compile_markdown
 from .wrapper import step_replace_phml_wrapper
 
@@ -13,6 +13,7 @@ __all__ = [
     "step_replace_phml_wrapper",
     "step_compile_markdown",
     "step_expand_loop_tags",
+    "step_expand_lazy_loop_tags",
     "step_ensure_doctype",
     "step_add_cached_component_elements",
 ]
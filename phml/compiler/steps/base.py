@@ -1,20 +1,104 @@
+from __future__ import annotations
+
 from functools import wraps
-from typing import Any, Callable
+from typing import Any, Callable, Iterable, NamedTuple
 
 from phml.components import ComponentManager
-from phml.nodes import AST, Parent
+from phml.nodes import AST, Element, Node, Parent
+
+__all__ = [
+    "scoped_step",
+    "setup_step",
+    "post_step",
+    "Features",
+    "StepFilter",
+    "scan_features",
+    "scan_document",
+]
+
+
+class Features(NamedTuple):
+    """The element tags and attribute names found in a set of nodes."""
+
+    tags: set[str]
+    attributes: set[str]
+
+
+class StepFilter(NamedTuple):
+    """The elements a scoped step acts on. The step is skipped for scopes, or whole documents,
+    without any of the elements.
+
+    Args:
+        tags (frozenset[str]): Element tags the step handles.
+        attributes (tuple[str, ...]): Attribute name prefixes the step handles.
+        components (bool): Whether the step handles elements that are components.
+    """
+
+    tags: frozenset[str] = frozenset()
+    attributes: tuple[str, ...] = ()
+    components: bool = False
+
+    def matches(self, features: Features, components: ComponentManager) -> bool:
+        """Whether any of the found features are handled by the step."""
+        return (
+            not self.tags.isdisjoint(features.tags)
+            or (
+                len(self.attributes) > 0
+                and any(attr.startswith(self.attributes) for attr in features.attributes)
+            )
+            or (self.components and any(tag in components for tag in features.tags))
+        )
 
-__all__ = ["scoped_step", "setup_step", "post_step"]
+
+def scan_features(nodes: Iterable[Node]) -> Features:
+    """Collect the tags and attribute names of the elements in nodes. Does not recurse."""
+    tags = set()
+    attributes = set()
+    for node in nodes:
+        if isinstance(node, Element):
+            tags.add(node.tag)
+            attributes.update(node._attributes)
+    return Features(tags, attributes)
+
+
+def scan_document(node: Parent, components: ComponentManager) -> Features:
+    """Recursively collect the tags and attribute names of a document and of the components
+    it uses.
+    """
+    tags = set()
+    attributes = set()
+    scanned = set()
+    stack = [node]
+    while len(stack) > 0:
+        current = stack.pop()
+        for child in current:
+            if isinstance(child, Element):
+                tags.add(child.tag)
+                attributes.update(child._attributes)
+                if child.children is not None:
+                    stack.append(child)
+                if child.tag in components and child.tag not in scanned:
+                    scanned.add(child.tag)
+                    stack.append(AST(list(components[child.tag]["elements"])))
+    return Features(tags, attributes)
 
 
 def scoped_step(
-    func: Callable[[Parent, ComponentManager, dict[str, Any]], None]
+    func: Callable[[Parent, ComponentManager, dict[str, Any]], None] | None = None,
+    *,
+    tags: Iterable[str] = (),
+    attributes: Iterable[str] = (),
+    components: bool = False,
 ):  # pragma: no cover
     """Wrapper for compilation steps. This wraps a function that takes a parent node,
     the current context, and component manager. The function is expected to mutate the children nodes.
     It is also expected that the function is not recursive and only mutates the direct children of the node
     passed in.
 
+    The wrapper can be given the tags, attribute name prefixes, and/or component elements the step
+    acts on, i.e. `@scoped_step(tags=["For"])`. The compiler then only runs the step for scopes that
+    have those elements. Steps without any are run for every scope.
+
     Args:
         Node (Parent): The parent node that is the current scope
         components (ComponentManager): The manager instance for the components
@@ -25,6 +109,11 @@ def scoped_step(
         This wrapper will predictably and automatically pass the arguments that are specified.
     """
 
+    if func is None:
+        return lambda func: scoped_step(
+            func, tags=tags, attributes=attributes, components=components
+        )
+
     @wraps(func)
     def inner(
         node: Parent,
@@ -38,6 +127,8 @@ def scoped_step(
             )
         return func(node, components, context)
 
+    step_filter = StepFilter(frozenset(tags), tuple(attributes), components)
+    inner.handles = step_filter if step_filter != StepFilter() else None
     return inner
 
 
@@ -1,63 +1,100 @@
+from __future__ import annotations
+
 import re
-from copy import deepcopy
 from typing import Any, TypedDict
 
-from phml.components import ComponentManager
+from phml.cache import LRUCache
+from phml.components import ComponentManager, ComponentTemplate, ComponentType
 from phml.helpers import iterate_nodes, normalize_indent
 from phml.nodes import AST, Element, Literal, LiteralType, Node, Parent
 
 from .base import scoped_step, setup_step
-
-re_selector = re.compile(r"(\n|\}| *)([^}@/]+)(\s*{)")
-re_split_selector = re.compile(r"(?:\)(?:.|\s)*|(?<!\()(?:.|\s)*)(,)")
-
-
-def lstrip(value: str) -> tuple[str, str]:
-    offset = len(value) - len(value.lstrip())
-    return value[:offset], value[offset:]
+from .loops import LazyLoop
+
+_STRINGS_AND_COMMENTS = r"""/\*.*?(?:\*/|\Z)|"(?:\\.|[^"\\\n])*"?|'(?:\\.|[^'\\\n])*'?"""
+re_css_token = re.compile(rf"{_STRINGS_AND_COMMENTS}|[{{}};]", re.DOTALL)
+re_selector_token = re.compile(rf"{_STRINGS_AND_COMMENTS}|[()\[\],]", re.DOTALL)
+re_css_leading = re.compile(r"(?:\s|/\*.*?(?:\*/|\Z))*", re.DOTALL)
+re_at_rule = re.compile(r"@([\w-]+)")
+
+GROUP_RULES = frozenset(
+    {"media", "supports", "layer", "container", "document", "scope", "starting-style"}
+)
+"""At-rules whose blocks have style rules that are scoped."""
+
+STYLE_CACHE: LRUCache[tuple, str] = LRUCache(256)
+"""Scoped component styles by the component hash and the style contents."""
+
+
+def scope_selector(selector: str, scope: str) -> str:
+    """Add a scope to each selector in a comma separated list of selectors."""
+    parts = []
+    start = 0
+    depth = 0
+    for token in re_selector_token.finditer(selector):
+        char = token.group()
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth = max(0, depth - 1)
+        elif char == "," and depth == 0:
+            parts.append(selector[start : token.start()])
+            start = token.end()
+    parts.append(selector[start:])
+
+    for i, part in enumerate(parts):
+        offset = re_css_leading.match(part).end()
+        if offset < len(part):
+            parts[i] = f"{part[:offset]}{scope} {part[offset:]}"
+    return ",".join(parts)
 
 
 def scope_style(style: str, scope: str) -> str:
-    """Takes a styles string and adds a scope to the selectors."""
-
-    next_style = re_selector.search(style)
-    result = ""
-    while next_style is not None:
-        start, end = next_style.start(), next_style.start() + len(next_style.group(0))
-        leading, selector, trail = next_style.groups()
-        if start > 0:
-            result += style[:start]
-        result += leading
-
-        parts = [""]
-        balance = 0
-        for char in selector:
-            if char == "," and balance == 0:
-                parts.append("")
-                continue
-            elif char == "(":
-                balance += 1
-            elif char == ")":
-                balance = min(0, balance - 1)
-            parts[-1] += char
-
-        for i, part in enumerate(parts):
-            w, s = lstrip(part)
-            parts[i] = w + f"{scope} {s}"
-        result += ",".join(parts) + trail
-
-        style = style[end:]
-        next_style = re_selector.search(style)
-    if len(style) > 0:
-        result += style
-
-    return result
-
-
-def scope_styles(styles: list[Element], hash: int) -> str:
-    """Parse styles and find selectors with regex. When a selector is found then add scoped
-    hashed data attribute to the selector.
+    """Takes a styles string and adds a scope to the selectors.
+
+    The styles are read once from start to end. Style rules at the top level and inside of
+    group at-rules, i.e. `@media`, are scoped. The contents of other at-rules, i.e.
+    `@keyframes`, and nested style rules are left as is, along with comments and strings.
+    """
+    result = []
+    # Whether the style rules of each open block are scoped
+    blocks = [True]
+    start = 0
+    for token in re_css_token.finditer(style):
+        char = token.group()
+        if char == "{":
+            prelude = style[start : token.start()]
+            if not blocks[-1]:
+                result.append(prelude)
+                blocks.append(False)
+            else:
+                at_rule = re_at_rule.match(prelude, re_css_leading.match(prelude).end())
+                if at_rule is None:
+                    result.append(scope_selector(prelude, scope))
+                    blocks.append(False)
+                else:
+                    result.append(prelude)
+                    blocks.append(at_rule.group(1).lower() in GROUP_RULES)
+            result.append(char)
+            start = token.end()
+        elif char in "};":
+            result.append(style[start : token.end()])
+            start = token.end()
+            if char == "}" and len(blocks) > 1:
+                blocks.pop()
+    result.append(style[start:])
+    return "".join(result)
+
+
+def scope_styles(styles: list[Element], hash: str) -> str:
+    """Combine the styles of a component and add the scoped hashed data attribute to the
+    selectors of the `scoped` styles. The result is cached by the component hash and styles.
     """
+    key = (hash, tuple((style[0].content, "scoped" in style) for style in styles))
+    cached = STYLE_CACHE.get(key)
+    if cached is not None:
+        return cached
+
     result = []
     for style in styles:
         content = normalize_indent(style[0].content)
@@ -66,7 +103,40 @@ def scope_styles(styles: list[Element], hash: int) -> str:
 
         result.append(content)
 
-    return "\n".join(result)
+    combined = "\n".join(result)
+    STYLE_CACHE.set(key, combined)
+    return combined
+
+
+def component_assets(components: ComponentManager) -> list[tuple[str, str, str]]:
+    """The name, styles, and scripts of each component that has been used."""
+    return [
+        (
+            name,
+            scope_styles(cmpt["styles"], cmpt["hash"]),
+            "\n".join(normalize_indent(s[0].content) for s in cmpt["scripts"]),
+        )
+        for name, cmpt in components.get_cache().items()
+    ]
+
+
+def cached_component_elements(components: ComponentManager) -> list[Element]:
+    """Create the style and script elements for the components that have been used. If the
+    manager has an asset bundle the elements reference the bundled files instead.
+    """
+    assets = component_assets(components)
+    if components.assets is not None:
+        return components.assets.elements(assets)
+
+    style = "".join(f"\n{styles}" for _, styles, _ in assets)
+    script = "".join(f"\n{scripts}" for _, _, scripts in assets)
+
+    elements = []
+    if len(style.strip()) > 0:
+        elements.append(Element("style", children=[Literal(LiteralType.Text, style)]))
+    if len(script.strip()) > 0:
+        elements.append(Element("script", children=[Literal(LiteralType.Text, script)]))
+    return elements
 
 
 @setup_step
@@ -80,30 +150,11 @@ def step_add_cached_component_elements(node: AST, components: ComponentManager,
                 if isinstance(c, Element) and c.tag == "head":
                     target = c
 
-    cache = components.get_cache()
-    style = ""
-    script = ""
-    for cmpt in cache:
-        style += f'\n{scope_styles(cache[cmpt]["styles"], cache[cmpt]["hash"])}'
-
-        scripts = "\n".join(
-            normalize_indent(s[0].content) for s in cache[cmpt]["scripts"]
-        )
-        script += f"\n{scripts}"
-
-    if len(style.strip()) > 0:
-        style = Element("style", children=[Literal(LiteralType.Text, style)])
-        if target is not None:
-            target.append(style)
-        else:
-            node.append(style)
-
-    if len(script.strip()) > 0:
-        script = Element("script", children=[Literal(LiteralType.Text, script)])
+    for element in cached_component_elements(components):
         if target is not None:
-            target.append(script)
+            target.append(element)
         else:
-            node.append(script)
+            node.append(element)
 
 
 class SlotNames(TypedDict):
@@ -116,7 +167,8 @@ class SlotChildren(TypedDict):
     named: dict[str, list[Node]]
 
 
-def replace_slots(child: Element, component: Element):
+def find_slots(component: Element) -> SlotNames:
+    """Search a substituted component for its slots."""
     slots: SlotNames = {"__blank__": None, "named": {}}
     for node in iterate_nodes(component):
         if isinstance(node, Element) and node.tag == "Slot":
@@ -133,6 +185,41 @@ def replace_slots(child: Element, component: Element):
                         "Can not have more that one catch all slot in a component"
                     )
                 slots["__blank__"] = node
+    return slots
+
+
+def component_template(component: ComponentType) -> ComponentTemplate | None:
+    """The precomputed template of a component if its elements have not changed since it was
+    added.
+    """
+    template = component.get("template", None)
+    if template is not None and template.built_for(component["elements"]):
+        return template
+    return None
+
+
+def _follow(node: Parent, path: tuple[int, ...]) -> Node:
+    for idx in path:
+        node = node[idx]
+    return node
+
+
+def replace_slots(
+    child: Element, component: Element, template: ComponentTemplate | None = None
+):
+    """Replace the slots of a substituted component with the children of the component element.
+    The slots are found with the paths of the component's template if one is given, otherwise
+    the component is searched for them.
+    """
+    if template is not None:
+        slots: SlotNames = {
+            "__blank__": None if template.slot is None else _follow(component, template.slot),
+            "named": {
+                name: _follow(component, path) for name, path in template.named.items()
+            },
+        }
+    else:
+        slots = find_slots(component)
 
     children: SlotChildren = {"__blank__": [], "named": {}}
     for node in child:
@@ -167,34 +254,91 @@ def replace_slots(child: Element, component: Element):
                 parent.remove(node)
 
 
-@scoped_step
+class PureComponent(Element):
+    """Substituted component that is marked as pure with `Pure = True`. Its `key` is set until
+    it is compiled and cached. Copies of the compiled component have no key and are not
+    compiled again.
+    """
+
+    __slots__ = ("key",)
+
+    def __init__(self, key: tuple, attributes: dict[str, str]) -> None:
+        super().__init__("div", attributes, [])
+        self.key = key
+
+    def clone(self, lazy: bool = False) -> PureComponent:
+        node = super().clone(lazy)
+        node.key = None
+        return node
+
+
+def memoize_component(component: PureComponent, components: ComponentManager):
+    """Cache a compiled pure component with the names of the components used in it. Components
+    with lazy loops are not cached as their iterations are consumed when rendered.
+    """
+    names = {cmpt["hash"]: name for name, cmpt in components}
+    used = []
+    for node in iterate_nodes(component):
+        if isinstance(node, LazyLoop):
+            return
+        if isinstance(node, Element) and node is not component:
+            name = names.get(node.get("data-phml-cmpt-scope", None))
+            if name is not None:
+                used.append(name)
+
+    components.memo.set(component.key, (component.clone(), tuple(used)))
+
+
+def cached_component(
+    component: PureComponent, components: ComponentManager
+) -> Element | None:
+    """Copy of the compiled pure component if it is cached."""
+    cached = components.memo.get(component.key)
+    if cached is None:
+        return None
+
+    compiled, used = cached
+    for name in used:
+        components.cache(name, components[name])
+    return compiled.clone(lazy=True)
+
+
+@scoped_step(components=True)
 def step_substitute_components(
     node: Parent,
     components: ComponentManager,
     context: dict[str, Any],
 ):
-    """Step to substitute components in for matching nodes."""
+    """Step to substitute components in for matching nodes. Pure components without children
+    are marked so the compiler can use a copy of the compiled component with the same props.
+
+    The elements are lazy copies so only the parts of the component that are changed when
+    compiled are copied. The slots are found with the paths precomputed when the component
+    was added.
+    """
 
     for child in node:
         if isinstance(child, Element) and child.tag in components:
-            # Need a deep copy of the component as to not manipulate the cached comonent data
-            elements = deepcopy(components[child.tag]["elements"])
-            props = {**components[child.tag]["props"]}
-            context = {**child.context, **components[child.tag]["context"]}
+            cmpt = components[child.tag]
+            # Need a copy of the component as to not manipulate the cached comonent data
+            elements = [element.clone(lazy=True) for element in cmpt["elements"]]
+            props = {**cmpt["props"]}
+            context = {**child._context, **cmpt["context"]}
 
             attrs = {
                 key: value
-                for key, value in child.attributes.items()
+                for key, value in child._attributes.items()
                 if key.lstrip(":") in props
             }
             props.update(attrs)
             context.update(props)
 
-            component = Element(
-                "div",
-                attributes={"data-phml-cmpt-scope": f"{components[child.tag]['hash']}"},
-                children=[],
-            )
+            attributes = {"data-phml-cmpt-scope": f"{cmpt['hash']}"}
+            if cmpt.get("pure", False) and len(child) == 0:
+                key = (cmpt["hash"], tuple(sorted(attrs.items())))
+                component = PureComponent(key, attributes)
+            else:
+                component = Element("div", attributes=attributes, children=[])
 
             for elem in elements:
                 elem.parent = component
@@ -205,7 +349,7 @@ def step_substitute_components(
 
             if child.parent is not None:
                 idx = child.parent.index(child)
-                replace_slots(child, component)
+                replace_slots(child, component, component_template(cmpt))
                 child.parent[idx] = component
 
-            components.cache(child.tag, components[child.tag])
+            components.cache(child.tag, cmpt)
@@ -2,7 +2,7 @@ from enum import EnumType
 from typing import Any
 
 from phml.embedded import exec_embedded
-from phml.helpers import build_recursive_context
+from phml.helpers import build_scope
 from phml.nodes import Element, Parent
 
 from .base import scoped_step
@@ -60,7 +60,7 @@ def get_element_condition(node: Element) -> int:
     return conditions[0]
 
 
-def validate_condition(prev: int, cond: int, position) -> bool:
+def validate_condition(prev: int, cond: int, node: Parent) -> bool:
     """Validate that the new condition element is valid following the previous element."""
     if (
         cond > Condition.NONE and cond <= Condition.ELSE
@@ -73,7 +73,7 @@ def validate_condition(prev: int, cond: int, position) -> bool:
     ):
         return True
     raise ValueError(
-        f"Invalid condition element order at {position!r}. Expected if -> (elif -> else) | else"
+        f"Invalid condition element order at {node.position!r}. Expected if -> (elif -> else) | else"
     )
 
 
@@ -86,7 +86,7 @@ def build_condition_trees(node: Element) -> list[list[Element]]:
         if isinstance(child, Element):
             condition = get_element_condition(child)
             if condition > Condition.NONE and validate_condition(
-                previous, condition, node.position
+                previous, condition, node
             ):
                 if condition == Condition.IF:
                     condition_trees.append([(condition, child)])
@@ -98,7 +98,7 @@ def build_condition_trees(node: Element) -> list[list[Element]]:
 
 
 def get_condition_result(
-    cond: tuple[int, Element], context: dict[str, Any], position
+    cond: tuple[int, Element], context: dict[str, Any], node: Parent
 ) -> bool:
     """Parse the python condition in the attribute and return the result.
 
@@ -112,13 +112,13 @@ def get_condition_result(
         result = exec_embedded(
             code,
             f"<{cond[1].tag} {condition}='{code}'>",
-            **build_recursive_context(cond[1], context),
+            build_scope(cond[1], context),
         )
 
         if not isinstance(result, bool):
             raise ValueError(
                 "Expected boolean expression in condition "
-                + f"attribute '{condition}' at {position!r}",
+                + f"attribute '{condition}' at {node.position!r}",
             )
 
         return result
@@ -129,7 +129,7 @@ def compile_condition_trees(node, trees: list[list[tuple[int, Element]]], contex
     """Compiles the conditions. This will removed False condition nodes and keep True condition nodes."""
     for tree in trees:
         for i, cond in enumerate(tree):
-            result = get_condition_result(cond, context, node.position)
+            result = get_condition_result(cond, context, node)
             if not result:
                 cond[1].parent.remove(cond[1])
             else:
@@ -139,7 +139,8 @@ def compile_condition_trees(node, trees: list[list[tuple[int, Element]]], contex
                 break
 
 
-@scoped_step
+# Failed loops are replaced with an @if condition
+@scoped_step(tags=["For"], attributes=["@if", "@elif", "@else"])
 def step_execute_conditions(
     node: Parent,
     _,
@@ -1,20 +1,19 @@
 from typing import Any
 
-from phml.embedded import exec_embedded, exec_embedded_blocks
-from phml.helpers import build_recursive_context
+from phml.embedded import Namespace, exec_embedded, exec_embedded_blocks
+from phml.helpers import build_scope
 from phml.nodes import Element, Literal, Parent
 
 from .base import scoped_step
 
 
-def _process_attributes(node: Element, context: dict[str, Any]):
-    context = build_recursive_context(node, context)
+def _process_attributes(node: Element, scope: Namespace):
     for attribute in list(node.attributes.keys()):
         if attribute.startswith(":"):
             result = exec_embedded(
                 str(node[attribute]).strip(),
                 f"<{node.tag} {attribute}='{node[attribute]}'>",
-                **context,
+                scope,
             )
             if result is not None:
                 node.pop(attribute, None)
@@ -24,7 +23,7 @@ def _process_attributes(node: Element, context: dict[str, Any]):
                 value = exec_embedded_blocks(
                     str(node.attributes[attribute]).strip(),
                     f"<{node.tag} {attribute}='{node.attributes[attribute]}'>",
-                    **context,
+                    scope,
                 )
                 if value is not None:
                     node[attribute] = value
@@ -32,20 +31,30 @@ def _process_attributes(node: Element, context: dict[str, Any]):
 
 @scoped_step
 def step_execute_embedded_python(node: Parent, _, context: dict[str, Any]):
-    """Step to process embedded python inside of attributes and text nodes."""
+    """Step to process embedded python inside of attributes and text nodes. The embedded python
+    of the children is executed in one namespace for the scope.
+    """
+    namespace = None
     for child in node:
         if isinstance(child, Element):
+            if len(child._attributes) == 0:
+                continue
+            if namespace is None:
+                namespace = Namespace(build_scope(node, context))
+            # Elements with their own context add it to the scope's namespace
+            own = child._context
             _process_attributes(
-                child,
-                build_recursive_context(child, context),
+                child, Namespace(namespace, **own) if len(own) > 0 else namespace
             )
         elif (
             Literal.is_text(child)
             and "{{" in child.content
             and child.parent.tag not in ["script", "style", "python"]
         ):
+            if namespace is None:
+                namespace = Namespace(build_scope(node, context))
             child.content = exec_embedded_blocks(
                 child.content.strip(),
                 f"Text in <{node.tag}> at {node.position!r}",
-                **build_recursive_context(child, context),
+                namespace,
             )
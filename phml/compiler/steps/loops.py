@@ -1,12 +1,149 @@
 import re
-from copy import deepcopy
-from typing import Any
+from typing import Any, Callable, Iterator
 
+from phml.components import ComponentManager
 from phml.embedded import exec_embedded
-from phml.helpers import build_recursive_context
-from phml.nodes import Element, Literal, Parent
+from phml.helpers import build_scope
+from phml.nodes import AST, Element, Literal, Node, Parent
 
-from .base import scoped_step
+from .base import scan_document, scoped_step
+
+
+class LazyLoop(Element):
+    """`<For>` element that is expanded one iteration at a time while it is rendered. Only one
+    iteration of the loop is in memory at a time.
+
+    The fallback siblings of the loop, and the comments between them, are moved into the lazy loop
+    and are rendered after the iterations or in place of them.
+
+    Note:
+        The iterations are consumed as the loop is rendered so the compiled ast can only be
+        rendered once.
+    """
+
+    __slots__ = ("source", "trailing", "compile_context", "components", "steps")
+
+    def __init__(
+        self,
+        loop: Element,
+        trailing: list[Node],
+        source: Iterator[dict[str, Any]],
+        context: dict[str, Any],
+        components: ComponentManager,
+    ) -> None:
+        super().__init__(
+            "For",
+            loop._attributes,
+            list(loop.children or []),
+            parent=loop.parent,
+            in_pre=loop.in_pre,
+        )
+        self._context = loop._context
+        self.source = source
+        self.trailing = trailing
+        self.compile_context = context
+        self.components = components
+        # Scoped steps of the compile that created the loop
+        self.steps: tuple[Callable, ...] | None = None
+
+
+def _gen_new_children(node: Parent, context: dict[str, Any]) -> list:
+    new_children = [child.clone(lazy=True) for child in node]
+    for child in new_children:
+        if isinstance(child, Element):
+            child.context.update(context)
+        child.position = None
+    return new_children
+
+
+def _lazy_scope(loop: LazyLoop, children: list[Node]) -> Element:
+    """Element to process the children of an iteration in. It takes the place of the loops
+    parent so the children have the same context and parent tag as the loops children would.
+    """
+    parent = loop.parent
+    scope = Element(
+        "" if parent is None or isinstance(parent, AST) else parent.tag,
+        children=children,
+        parent=parent,
+    )
+    return scope
+
+
+def expand_lazy_loop(loop: LazyLoop) -> Iterator[Element]:
+    """Yield a scope element with the new children for each iteration of a lazy loop. The
+    children still need the compile steps that run after the loops are expanded.
+
+    If the loop fails before the first iteration, the fallbacks are yielded like `<For>` would.
+    Exceptions raised after the first iteration are raised as the iterations are already rendered.
+    """
+    iterations = 0
+    try:
+        for captures in loop.source:
+            iterations += 1
+            yield _lazy_scope(loop, _gen_new_children(loop, captures))
+    except Exception as exc:
+        if iterations > 0:
+            raise
+        failure = exc
+    else:
+        failure = Exception("No iterations occured. Expected non empty iterator.")
+
+    if iterations > 0:
+        trailing = [
+            node.clone(lazy=True)
+            for node in loop.trailing
+            if not isinstance(node, Element)
+        ]
+    else:
+        # The loop acts as a false condition so fallbacks are evaluated in order
+        trailing = [Element("", {"@if": "False"})]
+        for node in loop.trailing:
+            node = node.clone(lazy=True)
+            if isinstance(node, Element):
+                node.context["_loop_fail_"] = failure
+            trailing.append(node)
+
+    if len(trailing) > 0:
+        yield _lazy_scope(loop, trailing)
+
+
+def _lazy_loop(
+    loop: Element,
+    captures: list[str],
+    components: ComponentManager,
+    context: dict[str, Any],
+):
+    """Replace a loop with a lazy loop. The loop variables of each iteration are created from a
+    generator as the loop is rendered.
+    """
+    def dict_key(a):
+        return f"'{a}':{a}"
+
+    if ":each" in loop:
+        _each = f':each="{loop[":each"]}"'
+    else:
+        _each = f'each="{loop["each"]}"'
+
+    source = exec_embedded(
+        f"({{{','.join(dict_key(key) for key in captures)}}} for {loop.get(':each', loop.get('each', ''))})",
+        f"<For {_each}>",
+        build_scope(loop, context),
+    )
+
+    fallbacks = _get_fallbacks(loop)
+    parent = loop.parent
+    idx = parent.index(loop)
+    end = parent.index(fallbacks[-1]) if len(fallbacks) > 0 else idx
+    trailing = parent[idx + 1 : end + 1]
+    del parent[idx + 1 : end + 1]
+
+    # Components in the loop, and the components they use, must be cached before the post
+    # steps add their styles and scripts
+    for tag in scan_document(loop, components).tags:
+        if tag in components:
+            components.cache(tag, components[tag])
+
+    parent[idx] = LazyLoop(loop, trailing, source, context, components)
 
 
 def _update_fallbacks(node: Element, exc: Exception):
@@ -47,21 +184,42 @@ def replace_default(
     loop failure exception.
     """
     if node.parent is not None and len(node.parent) > 0:
-        node.attributes.pop("@elif", None)
-        node.attributes.pop("@else", None)
+        node.pop("@elif", None)
+        node.pop("@else", None)
         node.attributes["@if"] = "False"
 
         _update_fallbacks(node, exc)
 
 
-@scoped_step
+@scoped_step(tags=["For"])
 def step_expand_loop_tags(
     node: Parent,
-    _,
+    components: ComponentManager,
     context: dict[str, Any],
 ):
     """Step to process and expand all loop (<For/>) elements. Will also set loop elements
     to have a false condition attribute to allow for fallback sibling elements."""
+    _expand_loop_tags(node, components, context, False)
+
+
+@scoped_step(tags=["For"])
+def step_expand_lazy_loop_tags(
+    node: Parent,
+    components: ComponentManager,
+    context: dict[str, Any],
+):
+    """Same as `step_expand_loop_tags` except loops without condition attributes are replaced
+    with lazy loops that are expanded while rendering. The compiler runs it in place of
+    `step_expand_loop_tags` when compiling with `_lazy_loops`."""
+    _expand_loop_tags(node, components, context, True)
+
+
+def _expand_loop_tags(
+    node: Parent,
+    components: ComponentManager,
+    context: dict[str, Any],
+    lazy: bool,
+):
     if len(node) == 0:
         return
 
@@ -71,15 +229,6 @@ def step_expand_loop_tags(
         if isinstance(child, Element) and child.tag == "For" and len(node) > 0
     ]
 
-    def gen_new_children(node: Parent, context: dict[str, Any]) -> list:
-        new_children = deepcopy(node[:])
-        for child in new_children:
-            if isinstance(child, Element):
-                child.context.update(context)
-            child.parent = None
-            child._position = None
-        return new_children
-
     for loop in for_loops:
         parsed_loop = re.match(
             r"(?:for\\s*)?(?P<captures>.+) in (?P<source>.+):?",
@@ -96,6 +245,17 @@ def step_expand_loop_tags(
         captures = re.findall(r"([^\s,]+)", parsed_loop["captures"])
         parsed_loop["source"].strip()
 
+        if (
+            lazy
+            and loop.parent is not None
+            and not any(cond in loop for cond in ["@if", "@elif", "@else"])
+        ):
+            try:
+                _lazy_loop(loop, captures, components, context)
+            except Exception as exec:
+                replace_default(loop, exec)
+            continue
+
         def dict_key(a):
             return f"'{a}':{a}"
 
@@ -122,8 +282,8 @@ for {loop.get(":each", loop.get("each", ""))}:
             iterations, new_nodes = exec_embedded(
                 process,
                 f"<For {_each}>",
-                **build_recursive_context(loop, context),
-                __gen_new_children__=gen_new_children,
+                build_scope(loop, context),
+                __gen_new_children__=_gen_new_children,
                 __node__=loop,
             )
 
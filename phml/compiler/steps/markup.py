@@ -30,7 +30,7 @@ except ImportError:  # pragma: no cover
     MARKDOWN = Markdown
 
 
-@scoped_step
+@scoped_step(tags=["Markdown"])
 def step_compile_markdown(
     node: Parent, components: ComponentManager, context: dict[str, Any]
 ):
@@ -94,6 +94,7 @@ def step_compile_markdown(
                 content = str(markdown.reset().convert(md_file.read()))
 
             phml = HypertextManager()
+            phml.parser = components.parser
             phml.components = components
             ast = phml.parse(content).ast
 
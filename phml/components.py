@@ -1,24 +1,173 @@
+from __future__ import annotations
+
+import json
 import os
+from copy import copy
+from hashlib import blake2b
 from pathlib import Path
 from re import finditer
-from time import time
-from typing import Any, Iterator, TypedDict, overload
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Iterator, NamedTuple, TypedDict, overload
 
-from .embedded import Embedded
+from .cache import LRUCache
+from .embedded import Embedded, ImportRegistry
 from .helpers import iterate_nodes
-from .nodes import Element, Literal
+from .nodes import Element, Literal, Node
 from .parser import HypertextMarkupParser
 
-__all__ = ["ComponentType", "ComponentManager", "tokenize_name"]
+if TYPE_CHECKING:
+    from .assets import AssetBundle
+
+__all__ = [
+    "ComponentType",
+    "ComponentTemplate",
+    "ComponentManager",
+    "StaticElement",
+    "tokenize_name",
+]
+
+DYNAMIC_TAGS = frozenset({"", "Template", "For", "Markdown", "Slot", "python"})
+"""Tags that are replaced or expanded when compiled so they are never static."""
+
+
+class StaticElement(Element):
+    """Element of a component that renders the same for every context. The compiler does not
+    process copies of it unless a compile step handles one of the `tags` or attribute `names`
+    of its descendants.
+    """
+
+    __slots__ = ("tags", "names")
+
+    def __init__(self, element: Element, tags: frozenset[str], names: frozenset[str]) -> None:
+        super().__init__(
+            element.tag,
+            element._attributes,
+            element.children,
+            element.position,
+            in_pre=element.in_pre,
+        )
+        self._context = element._context
+        self.tags = tags
+        self.names = names
+
+    def clone(self, lazy: bool = False) -> StaticElement:
+        node = super().clone(lazy)
+        node.tags = self.tags
+        node.names = self.names
+        return node
+
+
+class ComponentTemplate(NamedTuple):
+    """Layout of a component's elements that is found once when the component is added.
+
+    Args:
+        elements (tuple[Element | Literal, ...]): The elements the template was built for.
+        slot (tuple[int, ...] | None): Index path to the catch all `<Slot />`.
+        named (dict[str, tuple[int, ...]]): Index paths to the named `<Slot />`s.
+    """
+
+    elements: tuple[Element | Literal, ...]
+    slot: tuple[int, ...] | None
+    named: dict[str, tuple[int, ...]]
+
+    def built_for(self, elements: list[Element | Literal]) -> bool:
+        """Whether the template is for the current elements of the component."""
+        return len(self.elements) == len(elements) and all(
+            a is b for a, b in zip(self.elements, elements)
+        )
+
+    @staticmethod
+    def build(elements: list[Element | Literal]) -> ComponentTemplate:
+        """Copy a component's elements, find the paths to its slots, and replace the parts that
+        render the same for every context with `StaticElement`s.
+        """
+        elements = [element.clone() for element in elements]
+        slots: dict[str, Any] = {"slot": None, "named": {}}
+        for i, element in enumerate(elements):
+            features = _precompute(element, (i,), slots)
+            if features is not None and _worth_sharing(element):
+                elements[i] = StaticElement(element, *features)
+        return ComponentTemplate(tuple(elements), slots["slot"], slots["named"])
+
+
+def _worth_sharing(node: Node) -> bool:
+    return isinstance(node, Element) and node.children is not None and len(node) > 0
+
+
+def _precompute(
+    node: Node, path: tuple[int, ...], slots: dict[str, Any]
+) -> tuple[frozenset[str], frozenset[str]] | None:
+    """Record the slots in a node. Returns the tags and attribute names of the node's descendants
+    if it is static, otherwise the static children are replaced with `StaticElement`s.
+    """
+    if isinstance(node, Literal):
+        parent = node.parent
+        if (
+            Literal.is_text(node)
+            and "{{" in node.content
+            and not (isinstance(parent, Element) and parent.tag in ["script", "style"])
+        ):
+            return None
+        return frozenset(), frozenset()
+
+    if not isinstance(node, Element):
+        return None
+
+    if node.tag == "Slot":
+        if "name" in node:
+            name = str(node["name"])
+            if name in slots["named"]:
+                raise ValueError(
+                    "Can not have more that one of the same named slot in a component"
+                )
+            slots["named"][name] = path
+        else:
+            if slots["slot"] is not None:
+                raise ValueError("Can not have more that one catch all slot in a component")
+            slots["slot"] = path
+        return None
+
+    static = node.tag not in DYNAMIC_TAGS and not any(
+        key.startswith((":", "@")) or (isinstance(value, str) and "{{" in value)
+        for key, value in node._attributes.items()
+    )
+
+    tags = set()
+    names = set()
+    found = []
+    for i, child in enumerate(node):
+        features = _precompute(child, (*path, i), slots)
+        found.append(features)
+        if features is None:
+            static = False
+        elif isinstance(child, Element):
+            tags.add(child.tag)
+            names.update(child._attributes)
+            tags.update(features[0])
+            names.update(features[1])
+
+    if static:
+        # Normalized like the compiler would as static elements are not compiled
+        for key, value in node._attributes.items():
+            if isinstance(value, str):
+                node[key] = value.strip()
+        return frozenset(tags), frozenset(names)
+
+    for i, (child, features) in enumerate(zip(list(node), found)):
+        if features is not None and _worth_sharing(child):
+            node[i] = StaticElement(child, *features)
+    return None
 
 
 class ComponentType(TypedDict):
     hash: str
+    pure: bool
     props: dict[str, Any]
     context: dict[str, Any]
     scripts: list[Element]
     styles: list[Element]
     elements: list[Element | Literal]
+    template: ComponentTemplate
 
 
 class ComponentCacheType(TypedDict):
@@ -30,11 +179,13 @@ class ComponentCacheType(TypedDict):
 def DEFAULT_COMPONENT() -> ComponentType:
     return {
         "hash": "",
+        "pure": False,
         "props": {},
         "context": {},
         "scripts": [],
         "styles": [],
         "elements": [],
+        "template": ComponentTemplate((), None, {}),
     }
 
 
@@ -89,23 +240,48 @@ def _parse_cmpt_name(name: str) -> str:
     return "".join(tokens)
 
 
-def hash_component(cmpt: ComponentType):
-    """Hash a component for applying unique scope identifier"""
-    return (
-        sum(hash(element) for element in cmpt["elements"])
-        + sum(hash(style) for style in cmpt["styles"])
-        + sum(hash(script) for script in cmpt["scripts"])
-        - int(time() % 1000)
-    )
+def hash_component(cmpt: ComponentType) -> str:
+    """Hash a component for applying unique scope identifier. The hash is a digest of the
+    component's elements, styles, and scripts so it is the same in every process and run.
+    """
+    digest = blake2b(digest_size=8)
+    for key in ("elements", "styles", "scripts"):
+        nodes = [node.as_dict() for node in cmpt[key]]
+        digest.update(json.dumps(nodes, sort_keys=True, separators=(",", ":")).encode())
+    return digest.hexdigest()
 
 
 class ComponentManager:
     components: dict[str, ComponentType]
+    parser: HypertextMarkupParser
+    """Parser used for component sources. Can be shared with a `HypertextManager`."""
+    imports: ImportRegistry
+    """Modules exposed to the `<python>` elements of the components."""
+    memo: LRUCache[tuple, tuple[Element, tuple[str, ...]]]
+    """Compiled pure components by their hash and props, with the names of the components used
+    inside of them. Cleared when a component is added or removed.
+    """
+    assets: AssetBundle | None
+    """Writes the styles and scripts of the used components to shared files. When `None` they
+    are added to each page.
+    """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        parser: HypertextMarkupParser | None = None,
+        imports: ImportRegistry | None = None,
+    ) -> None:
         self.components = {}
-        self._parser = HypertextMarkupParser()
+        self.parser = parser or HypertextMarkupParser()
+        self.imports = imports or ImportRegistry()
+        self.memo = LRUCache(256)
+        self.assets = None
         self._cache: dict[str, ComponentCacheType] = {}
+        # Components added with `add_directory` are parsed the first time they are used
+        self._paths: dict[str, Path] = {}
+        self._mtimes: dict[str, int] = {}
+        self._checked: set[str] | None = None
+        self._lock = Lock()
 
     def generate_name(self, path: str, ignore: str = "") -> str:
         """Generate a component name based on it's path. Optionally strip part of the path
@@ -126,6 +302,16 @@ class ComponentManager:
         """Get the current cache of component scripts and styles"""
         return self._cache
 
+    def track(self) -> ComponentManager:
+        """A copy of the manager with its own cache of the components that are used. The
+        components, parser, imports, and memo are shared with the manager. Each compile or render
+        uses a copy so only the styles and scripts of the components used on that page are added.
+        """
+        tracker = copy(self)
+        tracker._cache = {}
+        tracker._checked = set()
+        return tracker
+
     def cache(self, key: str, value: ComponentType):
         """Add a cache for a specific component. Will only add the cache if
         the component is new and unique.
@@ -138,14 +324,14 @@ class ComponentManager:
             }
 
     def parse(self, content: str, path: str = "") -> ComponentType:
-        ast = self._parser.parse(content)
+        ast = self.parser.parse(content)
 
         component: ComponentType = DEFAULT_COMPONENT()
         context = Embedded("", path)
 
         for node in iterate_nodes(ast):
             if isinstance(node, Element) and node.tag == "python":
-                context += Embedded(node, path)
+                context += Embedded(node, path, self.imports)
                 if node.parent is not None:
                     node.parent.remove(node)
 
@@ -163,6 +349,7 @@ class ComponentManager:
                 component["elements"].append(node)
 
         component["props"] = context.context.pop("Props", {})
+        component["pure"] = bool(context.context.pop("Pure", False))
         component["context"] = context.context
         if len(component["elements"]) == 0:
             raise ValueError("Must have at least one root element in component")
@@ -243,11 +430,84 @@ class ComponentManager:
                 name = self.generate_name(file.as_posix(), ignore)
                 content.update(self.parse(c_file.read(), file.as_posix()))
 
+        self._paths.pop(name, None)
+        self._register(name, content)
+
+    def _register(self, name: str, content: ComponentType):
         self.validate(content)
+        template = ComponentTemplate.build(content["elements"])
+        content["elements"] = list(template.elements)
+        content["template"] = template
         content["hash"] = name + content["hash"]
         self.components[name] = content
+        self.memo.clear()
+
+    def add_directory(self, path: str | Path, ignore: str | None = None):
+        """Add the `.phml` files in a directory, and its sub directories, as components. Only
+        the names are found when they are added. Each component is parsed the first time it is
+        used, and parsed again when its file is changed.
+
+        Args:
+            path (str | Path): The directory with the component files.
+            ignore (str | None): The path prefix to remove before creating the component names.
+                Defaults to the directory.
+        """
+        path = Path(path)
+        if not path.is_dir():
+            raise ValueError(f"Expected path to be a directory but was {path.as_posix()!r}")
+
+        ignore = path.as_posix() if ignore is None else ignore
+        for file in sorted(path.rglob("*.phml")):
+            name = self.generate_name(file.as_posix(), ignore)
+            self._paths[name] = file
+            self._mtimes.pop(name, None)
+            self.components.pop(name, None)
+        self.memo.clear()
+
+    def refresh(self):
+        """Parse the components added with `add_directory` again if their files have changed
+        since they were used. Components whose files were removed are removed.
+        """
+        for name in list(self._mtimes):
+            try:
+                self._resolve(name)
+            except KeyError:
+                pass
+
+    def _resolve(self, name: str) -> ComponentType:
+        """Get a component, parsing it first if it was added with `add_directory` and it has not
+        been parsed or its file has changed. Copies made with `track` check the file once. If the
+        file was removed the component is removed and a `KeyError` is raised.
+        """
+        path = self._paths.get(name, None)
+        if path is None or (self._checked is not None and name in self._checked):
+            return self.components[name]
+
+        with self._lock:
+            try:
+                mtime = path.stat().st_mtime_ns
+            except FileNotFoundError:
+                self._paths.pop(name, None)
+                self._mtimes.pop(name, None)
+                self.components.pop(name, None)
+                self.memo.clear()
+                raise KeyError(
+                    f"{name} is not a known component, its file {path.as_posix()!r} was removed"
+                ) from None
+            if name not in self.components or self._mtimes.get(name, None) != mtime:
+                content: ComponentType = DEFAULT_COMPONENT()
+                content.update(self.parse(path.read_text(encoding="utf-8"), path.as_posix()))
+                self._register(name, content)
+                self._mtimes[name] = mtime
+
+        if self._checked is not None:
+            self._checked.add(name)
+        return self.components[name]
 
     def __iter__(self) -> Iterator[tuple[str, ComponentType]]:
+        """The parsed components. Components added with `add_directory` are included once they
+        have been used.
+        """
         yield from self.components.items()
 
     def keys(self):
@@ -257,10 +517,10 @@ class ComponentManager:
         return self.components.values()
 
     def __contains__(self, key: str) -> bool:
-        return key in self.components
+        return key in self.components or key in self._paths
 
     def __getitem__(self, key: str) -> ComponentType:
-        return self.components[key]
+        return self._resolve(key)
 
     def __setitem__(self, key: str, value: ComponentType):
         # TODO: Custom error
@@ -268,9 +528,12 @@ class ComponentManager:
 
     def remove(self, key: str):
         """Remove a comopnent from the manager with a specific tag/name."""
-        if key not in self.components:
+        if key not in self:
             raise KeyError(f"{key} is not a known component")
-        del self.components[key]
+        self.components.pop(key, None)
+        self._paths.pop(key, None)
+        self._mtimes.pop(key, None)
+        self.memo.clear()
 
     def validate(self, data: ComponentType):
         if "props" not in data or not isinstance(data["props"], dict):
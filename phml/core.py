@@ -8,21 +8,24 @@ from pathlib import Path
 from typing import TYPE_CHECKING, Any, NoReturn, overload
 
 if TYPE_CHECKING:
-    from collections.abc import Iterator
+    from collections.abc import Callable, Iterator
 
-from .compiler import HypertextMarkupCompiler
+from .assets import AssetBundle
+from .cache import CacheInfo, ParseCache
+from .compiler import HypertextMarkupCompiler, Pipeline, StepStage
 from .components import ComponentManager, ComponentType
-
-# TODO: Optimize and extract manipulation of import dicts
-from .embedded import __FROM_IMPORTS__, __IMPORTS__, Module
+from .embedded import ImportRegistry, Module
 from .helpers import PHMLTryCatch
 from .nodes import AST, Node, Parent
 from .parser import HypertextMarkupParser
+from .template import CompiledTemplate
 
 
 class HypertextManager:
     parser: HypertextMarkupParser
-    """PHML parser."""
+    """PHML parser. Shared with the component manager. By default it caches parsed sources
+    in memory. Assign `parser.cache = ParseCache(directory=...)` to keep the cache between runs.
+    """
     compiler: HypertextMarkupCompiler
     """PHML compiler to HTML."""
     components: ComponentManager
@@ -33,9 +36,10 @@ class HypertextManager:
     """
 
     def __init__(self) -> None:
-        self.parser = HypertextMarkupParser()
-        self.compiler = HypertextMarkupCompiler()
-        self.components = ComponentManager()
+        imports = ImportRegistry()
+        self.parser = HypertextMarkupParser(cache=ParseCache())
+        self.compiler = HypertextMarkupCompiler(Pipeline.default(), imports)
+        self.components = ComponentManager(self.parser, imports)
         self.context = {"Module": Module}
         self._ast: AST | None = None
         self._from_path = None
@@ -69,11 +73,56 @@ class HypertextManager:
 
     @property
     def imports(self) -> dict:
-        return dict(__IMPORTS__)
+        return dict(self.compiler.imports.imports)
 
     @property
     def from_imports(self) -> dict:
-        return dict(__FROM_IMPORTS__)
+        return {
+            module: dict(objects)
+            for module, objects in self.compiler.imports.from_imports.items()
+        }
+
+    @property
+    def memo_info(self) -> CacheInfo:
+        """Hits, misses, and size of the cache of compiled pure components. Components are
+        marked as pure with `Pure = True` in their `<python>` elements.
+        """
+        return self.components.memo.info
+
+    @property
+    def assets(self) -> AssetBundle | None:
+        """Where the styles and scripts of the used components are written. When set, i.e.
+        `phml.assets = AssetBundle("dist/assets", per="page")`, pages reference content hashed
+        files instead of inlining the styles and scripts. Defaults to `None`.
+        """
+        return self.components.assets
+
+    @assets.setter
+    def assets(self, assets: AssetBundle | None):
+        self.components.assets = assets
+
+    @property
+    def pipeline(self) -> Pipeline:
+        """The compile steps of this instance. It starts with the steps added with the module
+        level `add_step` when the instance is created.
+        """
+        return self.compiler.snapshot()
+
+    def add_step(self, step: Callable, stage: StepStage):
+        """Add a compile step to this instance. Compiles that have already started keep
+        the steps they started with.
+        """
+        self.compiler.pipeline = self.pipeline.add_step(step, stage)
+        return self
+
+    def remove_step(self, step: Callable, stage: StepStage):
+        """Remove a compile step from this instance."""
+        self.compiler.pipeline = self.pipeline.remove_step(step, stage)
+        return self
+
+    def _use_imports(self, imports: ImportRegistry):
+        self.compiler.imports = imports
+        self.components.imports = imports
 
     def add_module(
         self,
@@ -83,7 +132,7 @@ class HypertextManager:
         imports: list[str] | None = None,
     ) -> NoReturn:
         """Pass and imported a python file as a module. The modules are imported and added
-        to phml's cached imports. These modules are **ONLY** exposed to the python elements.
+        to this instance's imports. These modules are **ONLY** exposed to the python elements.
         To use them in the python elements or the other scopes in the files you must use the python
         import syntax `import <module>` or `from <module> import <...objects>`. PHML will parse
         the imports first and remove them from the python elements. It then checks it's cache of
@@ -156,30 +205,13 @@ class HypertextManager:
             name = f".{module.lstrip('..')}"
 
         # Add imported module or module objects to appropriate collection
-        if imports is not None and len(imports) > 0:
-            for _import in imports:
-                if name not in __FROM_IMPORTS__:
-                    __FROM_IMPORTS__[name] = {}
-                __FROM_IMPORTS__[name].update({_import: getattr(mod, _import)})
-        else:
-            __IMPORTS__[name] = mod
-
+        self._use_imports(self.compiler.imports.add(name, mod, imports))
         return name
 
     def remove_module(self, module: str, imports: list[str] | None = None):
         if not module.startswith("."):
             module = f".{module}"
-        if module in __IMPORTS__ and len(imports or []) == 0:
-            __IMPORTS__.pop(module, None)
-        if module in __FROM_IMPORTS__:
-            if imports is not None and len(imports) > 0:
-                for _import in imports:
-                    __FROM_IMPORTS__[module].pop(_import, None)
-                if len(__FROM_IMPORTS__[module]) == 0:
-                    __FROM_IMPORTS__.pop(module, None)
-            else:
-                __FROM_IMPORTS__.pop(module, None)
-
+        self._use_imports(self.compiler.imports.remove(module, imports))
         return self
 
     @property
@@ -272,13 +304,35 @@ class HypertextManager:
         """Compile the python blocks, python attributes, and phml components and return the resulting ast.
         The resulting ast replaces the core objects ast.
         """
+        return self._compile(context)
+
+    def _compile(self, context: dict[str, Any], lazy_loops: bool = False) -> Parent:
         context = {**self.context, **context, "_phml_path_": self._from_path}
         if self._ast is not None:
             with PHMLTryCatch(self._from_path, "phml:__compile__"):
-                ast = self.compiler.compile(self._ast, self.components, **context)
+                self.components.refresh()
+                ast = self.compiler.compile(
+                    self._ast, self.components, _lazy_loops=lazy_loops, **context
+                )
             return ast
         raise ValueError("Must first parse a phml file before compiling to an AST")
 
+    def template(self) -> CompiledTemplate:
+        """Create a compiled template from the current ast, components, and global context.
+        The template can be rendered many times with different context without compiling the
+        ast from scratch and without executing the `<python>` elements again.
+        """
+        if self._ast is None:
+            raise ValueError("Must first parse a phml file before creating a template")
+        return CompiledTemplate(
+            self._ast,
+            self.components,
+            self.context,
+            self._from_path,
+            self.compiler.snapshot(),
+            self.compiler.imports,
+        )
+
     def render(self, _compress: bool = False, **context: Any) -> str:
         """Renders the phml ast into an html string. If currently in a context manager
         the resulting string will also be output to an associated file.
@@ -286,10 +340,7 @@ class HypertextManager:
         context = {**self.context, **context, "_phml_path_": self._from_path}
         if self._ast is not None:
             with PHMLTryCatch(self._from_path, "phml:__render"):
-                result = self.compiler.render(
-                    self.compile(**context),
-                    _compress,
-                )
+                result = self.compiler.render(self.compile(**context), _compress)
 
                 if self._to_file is not None:
                     self._to_file.write(result)
@@ -303,6 +354,20 @@ class HypertextManager:
             return result
         raise ValueError("Must first parse a phml file before rendering a phml AST")
 
+    def stream(
+        self, _compress: bool = False, chunk_size: int = 8192, **context: Any
+    ) -> Iterator[str]:
+        """Render the phml ast in chunks of html. `<For>` elements are expanded one iteration
+        at a time as the chunks are rendered so only one iteration is in memory at a time.
+
+        Note:
+            Exceptions raised by a loop after its first iteration are raised instead of rendering
+            the loop's fallbacks. Condition attributes do not chain across the loop's iterations.
+            The styles and scripts of components used in a loop are added even if the loop is empty.
+        """
+        ast = self._compile(context, lazy_loops=True)
+        return self.compiler.iter_render(ast, _compress, chunk_size=chunk_size)
+
     def write(self, _path: str | Path, _compress: bool = False, **context: Any):
         """Render and write the current ast to a file.
 
@@ -314,7 +379,7 @@ class HypertextManager:
         path.parent.mkdir(parents=True, exist_ok=True)
 
         with path.open("+w", encoding="utf-8") as file:
-            file.write(self.compiler.render(self.compile(**context), _compress))
+            self.compiler.render_to(file, self.compile(**context), _compress)
         return self
 
     @overload
@@ -361,6 +426,14 @@ class HypertextManager:
         with PHMLTryCatch(file or name or "_cmpt_"):
             self.components.add(file, name=name, data=data, ignore=ignore)
 
+    def add_directory(self, path: str | Path, ignore: str | None = None):
+        """Add the `.phml` files in a directory as components. Each component is parsed the
+        first time it is used and parsed again when its file changes. See
+        `ComponentManager.add_directory`.
+        """
+        self.components.add_directory(path, ignore)
+        return self
+
     def remove(self, key: str):
         """Remove a component from the component manager based on the components name/tag."""
         self.components.remove(key)
@@ -4,6 +4,7 @@ Embedded has all the logic for processing python elements, attributes, and text
 from __future__ import annotations
 
 import ast
+import builtins
 import re
 import types
 from functools import cached_property
@@ -11,20 +12,28 @@ from html import escape
 from pathlib import Path
 from shutil import get_terminal_size
 from traceback import FrameSummary, extract_tb
-from typing import Any, Iterator, TypedDict
+from types import MappingProxyType
+from typing import Any, Iterator, Mapping, TypedDict
 
+from phml.cache import LRUCache
 from phml.embedded.built_in import built_in_funcs, built_in_types
 from phml.helpers import normalize_indent
-from phml.nodes import Element, Literal
+from phml.nodes import EMPTY_DICT, Element, Literal
 
 ESCAPE_OPTIONS = {
     "quote": False,
 }
 
-# Global cached imports
+# Global cached imports. Python imports are the same for every manager so they are cached for
+# the process. Modules added with `HypertextManager.add_module` are kept in an `ImportRegistry`.
 __IMPORTS__ = {}
 __FROM_IMPORTS__ = {}
 
+CODE_CACHE: LRUCache[str, types.CodeType] = LRUCache(1024)
+"""Compiled embedded python code keyed by the source code.
+Use `CODE_CACHE.info` to see the hits and misses.
+"""
+
 
 # PERF: Only allow assignments, methods, imports, and classes?
 class EmbeddedTryCatch:
@@ -179,18 +188,107 @@ class ImportStruct(TypedDict):
     values: str | list[str]
 
 
+class ImportRegistry:
+    """Modules and module objects exposed to the embedded python. Registries are immutable,
+    adding or removing a module returns a new registry. A registry can be used by many compiles
+    at once while a new one is created.
+
+    Modules that are not in the registry are looked up in the global cached imports.
+    """
+
+    __slots__ = ("imports", "from_imports")
+
+    imports: Mapping[str, Any]
+    """Imported modules by name."""
+    from_imports: Mapping[str, Mapping[str, Any]]
+    """Imported module objects by module name and object name."""
+
+    def __init__(
+        self,
+        imports: Mapping[str, Any] | None = None,
+        from_imports: Mapping[str, Mapping[str, Any]] | None = None,
+    ) -> None:
+        self.imports = MappingProxyType(dict(imports or {}))
+        self.from_imports = MappingProxyType(
+            {
+                module: MappingProxyType(dict(objects))
+                for module, objects in (from_imports or {}).items()
+            }
+        )
+
+    def get(self, module: str) -> Any | None:
+        """Get an imported module."""
+        if module in self.imports:
+            return self.imports[module]
+        return __IMPORTS__.get(module)
+
+    def get_objects(self, module: str) -> Mapping[str, Any] | None:
+        """Get the imported objects of a module."""
+        if module in self.from_imports:
+            return self.from_imports[module]
+        return __FROM_IMPORTS__.get(module)
+
+    def add(
+        self, name: str, module: Any, imports: list[str] | None = None
+    ) -> ImportRegistry:
+        """New registry with the module, or the given objects from the module, added."""
+        if imports is not None and len(imports) > 0:
+            from_imports = dict(self.from_imports)
+            from_imports[name] = {
+                **from_imports.get(name, {}),
+                **{_import: getattr(module, _import) for _import in imports},
+            }
+            return ImportRegistry(self.imports, from_imports)
+        return ImportRegistry({**self.imports, name: module}, self.from_imports)
+
+    def remove(self, name: str, imports: list[str] | None = None) -> ImportRegistry:
+        """New registry with the module, or the given objects from the module, removed."""
+        modules = dict(self.imports)
+        from_imports = dict(self.from_imports)
+        if len(imports or []) == 0:
+            modules.pop(name, None)
+        if name in from_imports:
+            if imports is not None and len(imports) > 0:
+                objects = {
+                    key: value
+                    for key, value in from_imports[name].items()
+                    if key not in imports
+                }
+                if len(objects) == 0:
+                    from_imports.pop(name, None)
+                else:
+                    from_imports[name] = objects
+            else:
+                from_imports.pop(name, None)
+        return ImportRegistry(modules, from_imports)
+
+    def bind(self, context: dict[str, Any]) -> dict[str, Any]:
+        """Make the `Module` in the context collect from this registry."""
+        if context.get("Module") is Module:
+            context["Module"] = lambda module, *, imports=None: Module(
+                module, imports=imports, registry=self
+            )
+        return context
+
+
 class Module:
     """Object used to access the gobal imports. Readonly data."""
 
-    def __init__(self, module: str, *, imports: list[str] | None = None) -> None:
+    def __init__(
+        self,
+        module: str,
+        *,
+        imports: list[str] | None = None,
+        registry: ImportRegistry | None = None,
+    ) -> None:
         self.objects = imports or []
+        self.registry = registry or ImportRegistry()
         if imports is not None and len(imports) > 0:
-            if module not in __FROM_IMPORTS__:
+            objects = self.registry.get_objects(module)
+            if objects is None:
                 raise ValueError(f"Unkown module {module!r}")
             try:
-                imports = {
-                    _import: __FROM_IMPORTS__[module][_import] for _import in imports
-                }
+                imports = {_import: objects[_import] for _import in imports}
             except KeyError as kerr:
                 back_frame = kerr.__traceback__.tb_frame.f_back
                 back_tb = types.TracebackType(
@@ -208,10 +306,10 @@ class Module:
             locals().update(imports)
             self.module = module
         else:
-            if module not in __IMPORTS__:
+            if self.registry.get(module) is None:
                 raise ValueError(f"Unkown module {module!r}")
 
-            imports = {module: __IMPORTS__[module]}
+            imports = {module: self.registry.get(module)}
             locals().update(imports)
             globals().update(imports)
             self.module = module
@@ -219,12 +317,11 @@ class Module:
     def collect(self) -> Any:
         """Collect the imports and return the single import or a tuple of multiple imports."""
         if len(self.objects) > 0:
+            objects = self.registry.get_objects(self.module)
             if len(self.objects) == 1:
-                return __FROM_IMPORTS__[self.module][self.objects[0]]
-            return tuple(
-                [__FROM_IMPORTS__[self.module][object] for object in self.objects]
-            )
-        return __IMPORTS__[self.module]
+                return objects[self.objects[0]]
+            return tuple([objects[object] for object in self.objects])
+        return self.registry.get(self.module)
 
 
 class EmbeddedImport:
@@ -237,9 +334,15 @@ class EmbeddedImport:
     """The imported objects."""
 
     def __init__(
-        self, module: str, values: str | list[str] | None = None, *, push: bool = False
+        self,
+        module: str,
+        values: str | list[str] | None = None,
+        *,
+        push: bool = False,
+        registry: ImportRegistry | None = None,
     ) -> None:
         self.module = module
+        self.registry = registry or ImportRegistry()
 
         if isinstance(values, list):
             self.objects = values
@@ -250,6 +353,15 @@ class EmbeddedImport:
             self.data
 
     def _parse_from_import(self):
+        objects = self.registry.from_imports.get(self.module)
+        if objects is not None:
+            return {
+                (key if isinstance(key, str) else key[1]): objects[
+                    key if isinstance(key, str) else key[0]
+                ]
+                for key in self.objects
+            }
+
         if self.module in __FROM_IMPORTS__:
             values = list(
                 filter(
@@ -274,6 +386,9 @@ class EmbeddedImport:
         return {key: __FROM_IMPORTS__[self.module][key] for key in keys}
 
     def _parse_import(self):
+        if self.module in self.registry.imports:
+            return {self.module: self.registry.imports[self.module]}
+
         if self.module not in __IMPORTS__:
             local_env = {}
             exec_val = compile(str(self), "_embedded_import_", "exec")
@@ -284,13 +399,15 @@ class EmbeddedImport:
 
     def __iter__(self) -> Iterator[tuple[str, Any]]:
         if len(self.objects) > 0:
-            if self.module not in __FROM_IMPORTS__:
+            objects = self.registry.get_objects(self.module)
+            if objects is None:
                 raise KeyError(f"{self.module} is not a known exposed module")
-            yield from __FROM_IMPORTS__[self.module].items()
+            yield from objects.items()
         else:
-            if self.module not in __IMPORTS__:
+            module = self.registry.get(self.module)
+            if module is None:
                 raise KeyError(f"{self.module} is not a known exposed module")
-            yield __IMPORTS__[self.module]
+            yield module
 
     @cached_property
     def data(self) -> dict[str, Any]:
@@ -324,8 +441,14 @@ class Embedded:
     to reduce duplicate imports.
     """
 
-    def __init__(self, content: str | Element, path: str | None = None) -> None:
+    def __init__(
+        self,
+        content: str | Element,
+        path: str | None = None,
+        registry: ImportRegistry | None = None,
+    ) -> None:
         self._path = path or "<python>"
+        self._registry = registry
         self._pos = (0, 0)
         if isinstance(content, Element):
             if len(content) > 1 or (
@@ -379,7 +502,11 @@ class Embedded:
             if imp_match is not None:
                 data = imp_match.groupdict()
                 imports.append(
-                    EmbeddedImport(data["key"] or data["value"], data["values"])
+                    EmbeddedImport(
+                        data["key"] or data["value"],
+                        data["values"],
+                        registry=self._registry,
+                    )
                 )
             elif re_context.match(lines[i]) is not None:
                 blocks.append("\n".join(current))
@@ -417,19 +544,7 @@ class Embedded:
         self.context = context
 
 
-def _validate_kwargs(code: ast.Module, kwargs: dict[str, Any]):
-    exclude_list = [*built_in_funcs, *built_in_types]
-    for var in (
-        name.id
-        for name in ast.walk(code)
-        if isinstance(
-            name,
-            ast.Name,
-        )  # Get all variables/names used. This can be methods or values
-        and name.id not in exclude_list
-    ):
-        if var not in kwargs:
-            kwargs[var] = None
+__BUILT_INS__ = frozenset([*built_in_funcs, *built_in_types])
 
 
 def update_ast_node_pos(dest, source):
@@ -445,7 +560,104 @@ def update_ast_node_pos(dest, source):
 RESULT = "_phml_embedded_result_"
 
 
-def exec_embedded(code: str, _path: str | None = None, **context: Any) -> Any:
+def _compile_embedded(code: str) -> types.CodeType:
+    """Compile embedded python so the result is assigned to `RESULT`. The compiled code is
+    cached by the source code.
+    """
+    cached = CODE_CACHE.get(code)
+    if cached is not None:
+        return cached
+
+    AST = ast.parse(normalize_indent(code))
+
+    last = AST.body[-1]
+    returns = [ret for ret in AST.body if isinstance(ret, ast.Return)]
+
+    if len(returns) > 0:
+        last = returns[0]
+        idx = AST.body.index(last)
+
+        n_expr = ast.Name(id=RESULT, ctx=ast.Store())
+        n_assign = ast.Assign(targets=[n_expr], value=last.value)
+
+        update_ast_node_pos(dest=n_expr, source=last)
+        update_ast_node_pos(dest=n_assign, source=last)
+
+        AST.body = [*AST.body[:idx], n_assign]
+    elif isinstance(last, ast.Expr):
+        n_expr = ast.Name(id=RESULT, ctx=ast.Store())
+        n_assign = ast.Assign(targets=[n_expr], value=last.value)
+
+        update_ast_node_pos(dest=n_expr, source=last)
+        update_ast_node_pos(dest=n_assign, source=last)
+
+        AST.body[-1] = n_assign
+    elif isinstance(last, ast.Assign):
+        n_expr = ast.Name(id=RESULT, ctx=ast.Store())
+        update_ast_node_pos(dest=n_expr, source=last)
+        last.targets.append(n_expr)
+
+    compiled = compile(AST, "_phml_embedded_", "exec")
+    CODE_CACHE.set(code, compiled)
+    return compiled
+
+
+class Namespace(dict):
+    """Namespace embedded python is executed in. Names are looked up in the scope the first time
+    they are used and are kept for the next embedded python executed in the namespace. Unknown
+    names are `None`.
+
+    Create one namespace for an element and execute each of its embedded python in it instead of
+    copying the context for each execution.
+    """
+
+    __slots__ = ("scope",)
+
+    def __init__(self, scope: Mapping[str, Any] | None = None, /, **values: Any) -> None:
+        super().__init__(values)
+        self.scope = scope if scope is not None else EMPTY_DICT
+
+    def __missing__(self, name: str) -> Any:
+        if isinstance(self.scope, Namespace) or name in self.scope:
+            value = self.scope[name]
+        elif name == "blank":
+            from phml.utilities import blank
+
+            value = blank
+        else:
+            value = builtins.__dict__.get(name)
+        self[name] = value
+        return value
+
+
+class _Locals(dict):
+    """Locals of a single execution. Names that are not assigned by the embedded python are
+    looked up in the namespace.
+    """
+
+    __slots__ = ("namespace",)
+
+    def __init__(self, namespace: Namespace) -> None:
+        super().__init__()
+        self.namespace = namespace
+
+    def __missing__(self, name: str) -> Any:
+        return self.namespace[name]
+
+
+def _namespace(scope: Mapping[str, Any] | None, context: dict[str, Any]) -> Namespace:
+    if isinstance(scope, Namespace) and len(context) == 0:
+        return scope
+    return Namespace(scope, **context)
+
+
+def exec_embedded(
+    code: str,
+    _path: str | None = None,
+    _scope: Mapping[str, Any] | None = None,
+    /,
+    **context: Any,
+) -> Any:
     """Execute embedded python and return the extracted value. This is the last
     assignment in the embedded python. The embedded python must have the last line as a value
     or an assignment.
@@ -455,61 +667,34 @@ def exec_embedded(code: str, _path: str | None = None, **context: Any) -> Any:
 
     Args:
         code (str): The embedded python code.
+        _scope (Mapping): Optional scope to look up the names used by the embedded python. A
+            `Namespace` is used directly, other mappings are wrapped in one.
         **context (Any): The additional context to provide to the embedded python.
 
     Returns:
         Any: The value of the last assignment or value defined
     """
-    from phml.utilities import blank
-
-    context = {
-        "blank": blank,
-        **context,
-    }
 
     # last line must be an assignment or the value to be used
     with EmbeddedTryCatch(_path, code):
-        code = normalize_indent(code)
-        AST = ast.parse(code)
-        _validate_kwargs(AST, context)
+        ccode = _compile_embedded(code)
 
-        last = AST.body[-1]
-        returns = [ret for ret in AST.body if isinstance(ret, ast.Return)]
+        local_env = _Locals(_namespace(_scope, context))
+        exec(ccode, local_env.namespace, local_env)
 
-        if len(returns) > 0:
-            last = returns[0]
-            idx = AST.body.index(last)
-
-            n_expr = ast.Name(id=RESULT, ctx=ast.Store())
-            n_assign = ast.Assign(targets=[n_expr], value=last.value)
-
-            update_ast_node_pos(dest=n_expr, source=last)
-            update_ast_node_pos(dest=n_assign, source=last)
-
-            AST.body = [*AST.body[:idx], n_assign]
-        elif isinstance(last, ast.Expr):
-            n_expr = ast.Name(id=RESULT, ctx=ast.Store())
-            n_assign = ast.Assign(targets=[n_expr], value=last.value)
-
-            update_ast_node_pos(dest=n_expr, source=last)
-            update_ast_node_pos(dest=n_assign, source=last)
-
-            AST.body[-1] = n_assign
-        elif isinstance(last, ast.Assign):
-            n_expr = ast.Name(id=RESULT, ctx=ast.Store())
-            update_ast_node_pos(dest=n_expr, source=last)
-            last.targets.append(n_expr)
-
-        ccode = compile(AST, "_phml_embedded_", "exec")
-        local_env = {}
-        exec(ccode, {**context}, local_env)
-
-        if isinstance(local_env[RESULT], str):
-            return escape(local_env[RESULT], **ESCAPE_OPTIONS)
-        return local_env[RESULT]
+        result = local_env.pop(RESULT)
+        if isinstance(result, str):
+            return escape(result, **ESCAPE_OPTIONS)
+        return result
 
 
-def exec_embedded_blocks(code: str, _path: str = "", **context: dict[str, Any]):
+def exec_embedded_blocks(
+    code: str,
+    _path: str = "",
+    _scope: Mapping[str, Any] | None = None,
+    /,
+    **context: dict[str, Any],
+):
     """Execute embedded python inside `{{}}` blocks. The resulting values are subsituted
     in for the found blocks.
 
@@ -518,12 +703,14 @@ def exec_embedded_blocks(code: str, _path: str = "", **context: dict[str, Any]):
 
     Args:
         code (str): The embedded python code.
+        _scope (Mapping): Optional scope to look up the names used by the embedded python.
         **context (Any): The additional context to provide to the embedded python.
 
     Returns:
         str: The value of the passed in string with the python blocks replaced.
     """
 
+    namespace = _namespace(_scope, context)
     result = [""]
     data = []
     next_block = re.search(r"\{\{", code)
@@ -548,7 +735,7 @@ def exec_embedded_blocks(code: str, _path: str = "", **context: dict[str, Any]):
                 exec_embedded(
                     code[: index - 2].strip(),
                     _path + f" block #{len(data)+1}",
-                    **context,
+                    namespace,
                 ),
             ),
         )
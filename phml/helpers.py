@@ -1,27 +1,30 @@
 import sys
+from collections import ChainMap
 from pathlib import Path
 from traceback import print_tb
-from typing import Any, Iterator
+from typing import Any, Iterator, Mapping
 
-from phml.nodes import AST, Element, Node, Parent
+from phml.nodes import AST, EMPTY_DICT, Element, Node, Parent
 
 
-def build_recursive_context(node: Node, context: dict[str, Any]) -> dict[str, Any]:
-    """Build recursive context for the current node."""
-    parent = node.parent
-    parents = []
-    result = {**context}
-
+def build_scope(node: Node, context: Mapping[str, Any]) -> ChainMap[str, Any]:
+    """Build the scope chain for the current node. Names are looked up in the context of the
+    node, then the contexts of its parents from the nearest to the furthest, then the given
+    context. The contexts are linked, not copied.
+    """
+    scopes = []
+    parent = node if isinstance(node, Element) else node.parent
     while parent is not None and not isinstance(parent, AST):
-        parents.append(parent)
+        if parent._context is not EMPTY_DICT and len(parent._context) > 0:
+            scopes.append(parent._context)
         parent = parent.parent
+    scopes.append(context)
+    return ChainMap(*scopes)
 
-    for parent in parents:
-        result.update(parent.context)
 
-    if isinstance(node, Element):
-        result.update(node.context)
-    return result
+def build_recursive_context(node: Node, context: dict[str, Any]) -> dict[str, Any]:
+    """Build recursive context for the current node."""
+    return dict(build_scope(node, context))
 
 
 def iterate_nodes(node: Parent) -> Iterator[Node]:
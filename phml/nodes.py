@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import re
+from bisect import bisect_right
 from enum import StrEnum, unique
 from types import NoneType
-from typing import Any, Iterator, NoReturn, TypeAlias, overload
+from typing import Any, Iterator, NoReturn, Self, TypeAlias, overload
 
 from saimll import SAIML
 
@@ -16,6 +18,34 @@ class Missing:
 MISSING = Missing()
 
 
+class EmptyDict(dict):
+    """Immutable empty dict. A single instance is shared by all elements that have no
+    attributes or context instead of each element allocating its own empty dict.
+    """
+
+    def __readonly(self, *_, **__):
+        raise TypeError("EmptyDict can not be modified")
+
+    __setitem__ = __delitem__ = __ior__ = __readonly
+    clear = pop = popitem = setdefault = update = __readonly
+
+    def __copy__(self) -> EmptyDict:
+        return self
+
+    def __deepcopy__(self, _) -> EmptyDict:
+        return self
+
+    def __reduce__(self):
+        return (_empty_dict, ())
+
+
+def _empty_dict() -> EmptyDict:
+    return EMPTY_DICT
+
+
+EMPTY_DICT = EmptyDict()
+
+
 def p_code(value) -> str:  # pragma: no cover
     """Get python code representation of phml nodes."""
     if value is None:
@@ -51,6 +81,8 @@ class Point:
     represents a character in a source file.
     """
 
+    __slots__ = ("line", "column")
+
     def __init__(self, line: int, column: int) -> None:
         if line is None or line < 0:
             raise IndexError(f"Point.line must be >= 0 but was {line}")
@@ -99,6 +131,8 @@ class Position:
     information.
     """
 
+    __slots__ = ("start", "end")
+
     @overload
     def __init__(
         self,
@@ -185,9 +219,45 @@ class Position:
         return f"\x1b[38;5;8m<\x1b[39m{self.start}\x1b[38;5;8m-\x1b[39m{self.end}\x1b[38;5;8m>\x1b[39m"
 
 
+class LineIndex:
+    """Table of the offsets where each line of a source string starts. Used to convert
+    a character offset into a line and column with a binary search instead of counting
+    the new lines that lead up to the offset.
+    """
+
+    __slots__ = ("starts", "length")
+
+    def __init__(self, source: str = "") -> None:
+        self.starts = [0]
+        self.length = 0
+        self.extend(source)
+
+    def extend(self, source: str):
+        """Index the lines of more source that directly follows the already indexed source."""
+        self.starts.extend(
+            self.length + match.end() for match in re.finditer("\n", source)
+        )
+        self.length += len(source)
+
+    def point(self, offset: int) -> Point:
+        """Get the line and column of a character offset in the source."""
+        line = bisect_right(self.starts, offset) - 1
+        return Point(line, offset - self.starts[line])
+
+    def position(self, start: int, end: int) -> Position:
+        """Get the position of the region of the source between two character offsets."""
+        return Position(self.point(start), self.point(end))
+
+    def __deepcopy__(self, _) -> LineIndex:
+        # Lines are only ever appended to the index so copies of nodes can share it
+        return self
+
+
 class Node:
     """Base phml node. Defines a type and basic interactions."""
 
+    __slots__ = ("_position", "_lines", "_start", "_end", "parent", "_type", "in_pre")
+
     def __init__(
         self,
         _type: NodeType,
@@ -196,6 +266,9 @@ class Node:
         in_pre: bool = False,
     ) -> None:
         self._position = position
+        self._lines: LineIndex | None = None
+        self._start = 0
+        self._end = 0
         self.parent = parent
         self._type = _type
         self.in_pre = in_pre
@@ -241,9 +314,50 @@ class Node:
     def position(self) -> Position | None:
         """The position of the node in the parsed phml text.
         Is `None` if the node was generated.
+
+        If the node was given source offsets the position is only created the first time
+        it is requested.
         """
+        if self._position is None and self._lines is not None:
+            self._position = self._lines.position(self._start, self._end)
         return self._position
 
+    @position.setter
+    def position(self, position: Position | None):
+        self._position = position
+        self._lines = None
+
+    def clone(self, lazy: bool = False) -> Self:
+        """Create a structural copy of the node. The copy has no parent.
+
+        Only the node structure is copied. Values shared between the nodes, like attribute
+        values and positions, are not copied.
+
+        Args:
+            lazy (bool): Only copy the children of a node the first time they are accessed.
+                Subtrees that are never accessed are never copied. The original node
+                must not be changed while a lazy copy of it is in use.
+        """
+        node = object.__new__(type(self))
+        node._position = self._position
+        node._lines = self._lines
+        node._start = self._start
+        node._end = self._end
+        node.parent = None
+        node._type = self._type
+        node.in_pre = self.in_pre
+        return node
+
+    def set_offsets(self, lines: LineIndex, start: int, end: int):
+        """Set the start and end character offsets of the node in the source it was
+        parsed from. The `Position` is built from the offsets and the shared line index
+        only when it is requested.
+        """
+        self._position = None
+        self._lines = lines
+        self._start = start
+        self._end = end
+
     @property
     def type(self) -> str:
         """The node type. Either root, element, or litera."""
@@ -283,6 +397,8 @@ class Node:
 
 
 class Parent(Node):
+    __slots__ = ("_children", "_origin", "_indices")
+
     def __init__(
         self,
         _type: NodeType,
@@ -297,6 +413,45 @@ class Parent(Node):
         if children is not None:
             self.extend(children)
 
+    @property
+    def children(self) -> list[Node] | None:
+        """The child nodes. Is `None` if the node is self closing."""
+        if self._origin is not None:
+            origin, self._origin = self._origin, None
+            self._indices = None
+            self._children = [child.clone(True) for child in origin.children]
+            for child in self._children:
+                child.parent = self
+        return self._children
+
+    @children.setter
+    def children(self, children: list[Node] | None):
+        self._origin = None
+        self._indices = None
+        self._children = children
+
+    def clone(self, lazy: bool = False) -> Self:
+        node = super().clone(lazy)
+        node._origin = None
+        node._indices = None
+        node._children = None
+        if self._origin is not None:
+            # Not copied yet so the children are still the same as the origin's children
+            if lazy:
+                node._origin = self._origin
+            else:
+                node._children = [child.clone() for child in self._origin.children]
+        elif self._children is not None:
+            if lazy and len(self._children) > 0:
+                node._origin = self
+            else:
+                node._children = [child.clone(lazy) for child in self._children]
+
+        if node._children is not None:
+            for child in node._children:
+                child.parent = node
+        return node
+
     def __p_code__(self) -> str:
         children = (
             "None"
@@ -374,16 +529,35 @@ class Parent(Node):
             return self.children.pop(idx)
         raise ValueError("A self closing element can not pop a child node")
 
+    def _index(self, node: Node) -> int:
+        """Find a child by identity. Indices are cached by the id of the child and the
+        cached index is checked before it is used, so changes to the children only cause
+        the cache to be rebuilt. If the node is not a child the first child that is equal
+        to it is used.
+        """
+        children = self.children
+        if self._indices is not None:
+            idx = self._indices.get(id(node))
+            if idx is not None and idx < len(children) and children[idx] is node:
+                return idx
+
+        self._indices = {id(child): i for i, child in enumerate(children)}
+        if (idx := self._indices.get(id(node))) is not None:
+            return idx
+        return children.index(node)
+
     def index(self, node: Node) -> int:
         """Get the index of a node in the children."""
         if self.children is not None:
-            return self.children.index(node)
+            return self._index(node)
         raise ValueError("A self closing element can not be indexed")
 
     def append(self, node: Node):
         """Append a child node to the end of the children."""
         if self.children is not None:
             node.parent = self
+            if self._indices is not None:
+                self._indices[id(node)] = len(self.children)
             self.children.append(node)
         else:
             raise ValueError(
@@ -421,7 +595,7 @@ class Parent(Node):
             raise ValueError(
                 "A child node can not be removed from a self closing element.",
             )
-        self.children.remove(node)
+        del self.children[self._index(node)]
 
     def len_as_str(self, color: bool = False) -> str:  # pragma: no cover
         if color:
@@ -461,6 +635,8 @@ class Parent(Node):
 
 
 class AST(Parent):
+    __slots__ = ()
+
     def __init__(
         self,
         children: list[Node] | None = None,
@@ -486,6 +662,8 @@ class AST(Parent):
 
 
 class Element(Parent):
+    __slots__ = ("tag", "_attributes", "_context")
+
     def __init__(
         self,
         tag: str,
@@ -497,8 +675,45 @@ class Element(Parent):
     ) -> None:
         super().__init__(NodeType.ELEMENT, children, position, parent, in_pre)
         self.tag = tag
-        self.attributes = attributes or {}
-        self.context = {}
+        self._attributes = attributes or EMPTY_DICT
+        self._context = EMPTY_DICT
+
+    def clone(self, lazy: bool = False) -> Self:
+        node = super().clone(lazy)
+        node.tag = self.tag
+        node._attributes = (
+            self._attributes if self._attributes is EMPTY_DICT else dict(self._attributes)
+        )
+        node._context = (
+            self._context if self._context is EMPTY_DICT else dict(self._context)
+        )
+        return node
+
+    @property
+    def attributes(self) -> dict[str, Attribute]:
+        """The attributes of the element. Elements without attributes share an immutable
+        empty dict which is replaced with a new dict when this property is first accessed.
+        """
+        if self._attributes is EMPTY_DICT:
+            self._attributes = {}
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, attributes: dict[str, Attribute]):
+        self._attributes = attributes
+
+    @property
+    def context(self) -> dict[str, Any]:
+        """Variables exposed to the embedded python of this element and its children.
+        Shares an immutable empty dict until this property is first accessed.
+        """
+        if self._context is EMPTY_DICT:
+            self._context = {}
+        return self._context
+
+    @context.setter
+    def context(self, context: dict[str, Any]):
+        self._context = context
 
     def __p_code__(self) -> str:
         children = (
@@ -507,18 +722,18 @@ class Element(Parent):
             else f"[{', '.join([p_code(child) for child in self])}]"
         )
         in_pre = f", in_pre={self.in_pre}" if self.in_pre else ""
-        return f"Element({self.tag!r}, position={p_code(self.position)}, attributes={self.attributes}, children={children}{in_pre})"
+        return f"Element({self.tag!r}, position={p_code(self.position)}, attributes={self._attributes}, children={children}{in_pre})"
 
     def __eq__(self, _o) -> bool:
         return (
             isinstance(_o, Element)
             and _o.tag == self.tag
             and (
-                len(self.attributes) == len(_o.attributes)
-                and all(key in self.attributes for key in _o.attributes)
+                len(self._attributes) == len(_o._attributes)
+                and all(key in self._attributes for key in _o._attributes)
                 and all(
-                    _o.attributes[key] == value
-                    for key, value in self.attributes.items()
+                    _o._attributes[key] == value
+                    for key, value in self._attributes.items()
                 )
             )
             and (
@@ -528,7 +743,7 @@ class Element(Parent):
         )
 
     def as_dict(self) -> dict:
-        return {"tag": self.tag, "attributes": self.attributes, **super().as_dict()}
+        return {"tag": self.tag, "attributes": self._attributes, **super().as_dict()}
 
     @staticmethod
     def from_dict(data: dict, in_pre: bool = False) -> Element:
@@ -559,12 +774,12 @@ class Element(Parent):
     def __hash__(self) -> int:
         return (
             hash(self.tag)
-            + sum(hash(attr) for attr in self.attributes.values())
+            + sum(hash(attr) for attr in self._attributes.values())
             + hash(len(self))
         )
 
     def __contains__(self, _k: str) -> bool:
-        return _k in self.attributes
+        return _k in self._attributes
 
     @overload
     def __getitem__(self, _k: int) -> Parent | Literal:
@@ -583,7 +798,7 @@ class Element(Parent):
         _k: str | int | slice,
     ) -> Attribute | Parent | Literal | list[Parent | Literal]:
         if isinstance(_k, str):
-            return self.attributes[_k]
+            return self._attributes[_k]
 
         if self.children is not None:
             return self.children[_k]
@@ -651,9 +866,11 @@ class Element(Parent):
         can be provided for when the value is not found, otherwise an error is thrown.
         """
         if isinstance(idx, str):
-            if _default != MISSING:
-                return self.attributes.pop(idx, _default)
-            return self.attributes.pop(idx)
+            if idx not in self._attributes:
+                if _default != MISSING:
+                    return _default
+                raise KeyError(idx)
+            return self._attributes.pop(idx)
         if self.children is not None:
             return self.children.pop(idx)
 
@@ -695,10 +912,10 @@ class Element(Parent):
                             if isinstance(value, str)
                             else f"\x1b[35m{value}\x1b[39m"
                         )
-                        for key, value in self.attributes.items()
+                        for key, value in self._attributes.items()
                     )
                 )
-                if len(self.attributes) > 0
+                if len(self._attributes) > 0
                 else ""
             )
         else:
@@ -706,17 +923,17 @@ class Element(Parent):
                 (
                     f"\n{' '*(indent)}▸ "
                     + f"\n{' '*(indent)}▸ ".join(
-                        f"{key}: {value!r}" for key, value in self.attributes.items()
+                        f"{key}: {value!r}" for key, value in self._attributes.items()
                     )
                 )
-                if len(self.attributes) > 0
+                if len(self._attributes) > 0
                 else ""
             )
 
         return attrs
 
     def __repr__(self) -> str:
-        return f"{self.type}.{self.tag}(cldrn={self.len_as_str()}, attrs={self.attributes})"
+        return f"{self.type}.{self.tag}(cldrn={self.len_as_str()}, attrs={self._attributes})"
 
     def __format__(
         self,
@@ -748,6 +965,8 @@ class Element(Parent):
 
 
 class Literal(Node):
+    __slots__ = ("name", "content")
+
     def __init__(
         self,
         name: str,
@@ -763,6 +982,12 @@ class Literal(Node):
     def __hash__(self) -> int:
         return hash(self.content) + hash(str(self.name))
 
+    def clone(self, lazy: bool = False) -> Self:
+        node = super().clone(lazy)
+        node.name = self.name
+        node.content = self.content
+        return node
+
     def __p_code__(self) -> str:
         in_pre = ", in_pre=True" if self.in_pre else ""
         return f"Literal({str(self.name)!r}, {self.content!r}{in_pre})"
@@ -1,12 +1,19 @@
 """Pythonic Hypertext Markup Language (phml) parser."""
 import re
+from collections.abc import Callable, Iterable, Iterator
 from copy import deepcopy
+from enum import StrEnum, unique
 from operator import itemgetter
+from sys import intern
+from typing import Literal as Lit
+from typing import NamedTuple
 
+from .cache import ParseCache
 from .nodes import (
     AST,
     Attribute,
     Element,
+    LineIndex,
     Literal,
     LiteralType,
     Parent,
@@ -14,18 +21,15 @@ from .nodes import (
     Position,
 )
 
+ParserEngine = Lit["cursor", "regex"]
+
 
 def strip(data: str, cur_tags: list[str]) -> str:
     """This function takes a possibly multiline string and strips leading and trailing
     blank lines. Given the current tag stack it will not strip the text if it is nested
     in a `pre` tag.
     """
-    if len(cur_tags) > 0 and (
-        cur_tags[-1] == "python"
-        or cur_tags[-1] == "script"
-        or cur_tags[-1] == "style"
-        or "pre" in cur_tags
-    ):
+    if len(cur_tags) > 0 and (cur_tags[-1] in raw_text or "pre" in cur_tags):
         return data
     return data.strip()
 
@@ -53,6 +57,16 @@ self_closing = [
 ]
 
 
+raw_text = [
+    "python",
+    "script",
+    "style",
+]
+"""Tags whose content is not parsed as markup. Everything up to the closing tag is kept as
+a single text node.
+"""
+
+
 # Main form of tokenization
 class RE:
     tag_start = re.compile(
@@ -75,13 +89,426 @@ class RE:
     bracket_attributte = re.compile(r"^\s*\{((?:\s|.)*)\/\}\s*$")
 
 
+def parse_attributes(
+    source: str,
+    start: int = 0,
+    end: int | None = None,
+) -> dict[str, Attribute]:
+    """Parse a tags attributes from the text found between the tag start and the tag end.
+    Optionally only the region between `start` and `end` of the string is parsed.
+
+    Example:
+        `<name (attributes)>`
+    """
+    attributes = {}
+    for attr in RE.attribute.finditer(source, start, len(source) if end is None else end):
+        (name, value, _, double, single, no_bracket) = itemgetter(
+            "name",
+            "value",
+            "curly",
+            "double",
+            "single",
+            "open",
+        )(attr.groupdict())
+
+        value = double or single or no_bracket
+
+        if value in ["yes", "true", None]:
+            value = True
+        elif value in ["no", "false"]:
+            value = False
+
+        attributes[intern(name)] = value
+    return attributes
+
+
+@unique
+class EventType(StrEnum):
+    START = "start"
+    """Opening tag of an element with children."""
+    END = "end"
+    """Closing tag of an element with children."""
+    EMPTY = "empty"
+    """Self closing element."""
+    DOCTYPE = "doctype"
+    TEXT = "text"
+    COMMENT = "comment"
+
+
+class ParseEvent(NamedTuple):
+    """A single token found in the source by the `MarkupTokenizer`."""
+
+    type: EventType
+    data: str
+    """The tag name for tag events and the content for text and comment events."""
+    attributes: dict[str, Attribute] | None
+    """The attributes of tag events. `None` for all other events."""
+    in_pre: bool
+    """Whether the token is nested in a `pre` element."""
+    start: int
+    """Offset of the first character of the token in the source."""
+    end: int
+    """Offset of the first character after the token in the source."""
+
+
+class MarkupTokenizer:
+    """Resumable tokenizer for html/xml like source code. Source is pushed in chunks and each
+    call to `tokenize` yields the events for all tokens that are complete. Incomplete tokens at
+    the end of the pushed source are kept until more source is pushed or the tokenizer is closed.
+    """
+
+    def __init__(self, auto_close: bool = True) -> None:
+        self.auto_close = auto_close
+        self.lines = LineIndex()
+        """Line index of all the source pushed so far."""
+        self.tag_stack: list[str] = []
+        """Current stack of tags in order of when they are opened."""
+        self.in_pre: int = 0
+        """Number of currently open pre elements."""
+        self._buffer = ""
+        self._offset = 0
+        self._raw: str | None = None
+        # Chunks pushed after the buffer, joined with it once a token can be completed
+        self._chunks: list[str] = []
+        # The pattern an incomplete token at the end of the buffer is waiting for, the end of the
+        # source new matches of it can start in, and the longest match of the pattern
+        self._waiting: tuple[re.Pattern, str, int | None] | None = None
+        # How many of the chunks have already been searched for the pattern
+        self._searched = 0
+
+    def push(self, chunk: str):
+        """Add source to the end of the unprocessed source."""
+        self.lines.extend(chunk)
+        self._chunks.append(chunk)
+
+    def _wait(self, source: str, pattern: re.Pattern, resume: int, width: int | None = None):
+        self._waiting = (pattern, source[resume:], width)
+        self._searched = 0
+
+    @staticmethod
+    def _resume_text(source: str, cursor: int) -> int:
+        """Where a tag start can begin in text that does not have one. Only the last `<` can be
+        the start of a tag once more source is pushed.
+        """
+        lt = source.rfind("<", cursor)
+        if lt == -1:
+            return len(source)
+        if len(source) - lt > 4 and source[lt + 1 :].lstrip("/").strip() != "":
+            return len(source)
+        return lt
+
+    def _pending(self, final: bool) -> bool:
+        """Whether the pushed chunks may complete the incomplete token at the end of the buffer.
+        Only the new chunks and the end of the buffer they can complete a token with are
+        searched, so the buffer is not joined and searched again for every chunk.
+        """
+        if final or self._waiting is None:
+            return True
+
+        pattern, tail, width = self._waiting
+        window = tail + "".join(self._chunks[self._searched :])
+        if pattern.search(window) is not None:
+            return True
+
+        if width is None:
+            resume = self._resume_text(window, 0)
+        else:
+            resume = max(0, len(window) - width + 1)
+        self._waiting = (pattern, window[resume:], width)
+        self._searched = len(self._chunks)
+        return False
+
+    def close(self) -> Iterator[ParseEvent]:
+        """Yield the events for the rest of the source. Raises an exception if the source
+        is incomplete.
+        """
+        yield from self.tokenize(final=True)
+        if len(self.tag_stack) > 0:
+            raise Exception(
+                f"The following tags where expected to be closed: {', '.join(repr(tag) for tag in self.tag_stack)}",
+            )
+
+    def _text(self, source: str, start: int, end: int) -> ParseEvent | None:
+        text = strip(source[start:end], self.tag_stack)
+        if text != "":
+            return ParseEvent(
+                EventType.TEXT,
+                text,
+                None,
+                self.in_pre > 0,
+                self._offset + start,
+                self._offset + end,
+            )
+        return None
+
+    def tokenize(self, final: bool = False) -> Iterator[ParseEvent]:
+        """Yield the events of all the complete tokens in the pushed source.
+
+        Args:
+            final (bool): Whether there is no more source to come. When `True`
+                the trailing text is emitted and unclosed tokens raise an exception.
+        """
+        if not self._pending(final):
+            return
+
+        if len(self._chunks) > 0:
+            self._buffer = self._buffer + "".join(self._chunks)
+            self._chunks.clear()
+        self._waiting = None
+
+        source = self._buffer
+        offset = self._offset
+        cursor = 0
+
+        try:
+            while True:
+                if self._raw is not None:
+                    close = source.find(f"</{self._raw}", cursor)
+                    if close == -1:
+                        if not final:
+                            marker = f"</{self._raw}"
+                            self._wait(
+                                source,
+                                re.compile(re.escape(marker)),
+                                max(cursor, len(source) - len(marker) + 1),
+                                len(marker),
+                            )
+                            return
+                        close = len(source)
+                    self._raw = None
+                    if (text := self._text(source, cursor, close)) is not None:
+                        yield text
+                    cursor = close
+
+                begin = RE.tag_start.search(source, cursor)
+                if begin is None:
+                    if final:
+                        if (text := self._text(source, cursor, len(source))) is not None:
+                            yield text
+                        cursor = len(source)
+                    else:
+                        self._wait(source, RE.tag_start, self._resume_text(source, cursor))
+                    return
+
+                start = begin.start()
+                if begin.group("comment") is not None:
+                    end = RE.comment_close.search(source, begin.end())
+                    if end is None:
+                        if final:
+                            raise Exception("Comment was not closed")
+                        self._wait(source, RE.comment_close, max(begin.end(), len(source) - 2), 3)
+                        return
+
+                    if (text := self._text(source, cursor, start)) is not None:
+                        yield text
+                    yield ParseEvent(
+                        EventType.COMMENT,
+                        source[begin.end() : end.start()],
+                        None,
+                        self.in_pre > 0,
+                        offset + start,
+                        offset + end.end(),
+                    )
+                    cursor = end.end()
+                    continue
+
+                opening = begin.group("opening") or begin.group("opening2")
+                end = RE.tag_end.search(source, begin.end())
+                if end is None:
+                    if final:
+                        raise Exception(
+                            f"Expected tag {begin.group(0)} to be closed with symbol '>'. Was not closed.",
+                        )
+                    self._wait(source, RE.tag_end, max(begin.end(), len(source) - 1), 2)
+                    return
+
+                if opening == "/" and source.find("<", begin.end(), end.start()) != -1:
+                    raise Exception(
+                        f"Closing tag {begin.group(0)!r} was not closed, maybe it is missing a '>' symbol"
+                    )
+
+                if (text := self._text(source, cursor, start)) is not None:
+                    yield text
+                cursor = end.end()
+
+                name = intern(begin.group("name") or "")
+                attributes = parse_attributes(source, begin.end(), end.start())
+
+                if opening == "/":
+                    if len(self.tag_stack) == 0:
+                        raise Exception(
+                            f"Unbalanced tags: Tag was closed without first being opened at {self.lines.position(offset + start, offset + cursor)}",
+                        )
+                    elif name != self.tag_stack[-1]:
+                        raise Exception(
+                            f"Unbalanced tags: {name!r} | {self.tag_stack[-1]!r} at {self.lines.position(offset + start, offset + cursor)}",
+                        )
+
+                    if self.tag_stack.pop() == "pre":
+                        self.in_pre -= 1
+                    event = EventType.END
+                elif opening == "!":
+                    event = EventType.DOCTYPE
+                elif (
+                    end.group("closing") != "/"
+                    and not (self.auto_close and name in self_closing)
+                    and opening is None
+                ):
+                    self.tag_stack.append(name)
+                    if name == "pre":
+                        self.in_pre += 1
+                    if name in raw_text:
+                        self._raw = name
+                    event = EventType.START
+                else:
+                    event = EventType.EMPTY
+
+                yield ParseEvent(
+                    event,
+                    name,
+                    attributes,
+                    self.in_pre > 0,
+                    offset + start,
+                    offset + cursor,
+                )
+        finally:
+            self._buffer = source[cursor:]
+            self._offset = offset + cursor
+
+
+class TreeBuilder:
+    """Build a phml AST from the events of a `MarkupTokenizer`."""
+
+    def __init__(self, lines: LineIndex) -> None:
+        self.lines = lines
+        self.root = AST()
+        self.current: Parent = self.root
+
+    def handle(self, event: ParseEvent):
+        """Add the node for the event to the tree."""
+        if event.type == EventType.TEXT or event.type == EventType.COMMENT:
+            node = Literal(
+                LiteralType.Text if event.type == EventType.TEXT else LiteralType.Comment,
+                event.data,
+                in_pre=event.in_pre,
+            )
+        elif event.type == EventType.END:
+            self.current.set_offsets(self.lines, self.current._start, event.end)
+            self.current = self.current.parent
+            return
+        elif event.type == EventType.DOCTYPE:
+            node = Element("doctype", {"lang": event.attributes.get("lang", "html")})
+        else:
+            node = Element(
+                event.data,
+                event.attributes,
+                [] if event.type == EventType.START else None,
+                in_pre=event.in_pre,
+            )
+
+        node.set_offsets(self.lines, event.start, event.end)
+        self.current.append(node)
+        if event.type == EventType.START:
+            self.current = node
+
+
+class IncrementalMarkupParser:
+    """Push style parser. Source is fed in chunks as it arrives and the AST is returned
+    when the parser is closed.
+
+    If a callback is provided the parser does not build a tree. Instead every event is passed
+    to the callback as soon as its token is complete.
+
+    Example:
+        ```python
+        parser = IncrementalMarkupParser()
+        for chunk in file:
+            parser.feed(chunk)
+        ast = parser.close()
+        ```
+    """
+
+    def __init__(
+        self,
+        auto_close: bool = True,
+        callback: Callable[[ParseEvent], None] | None = None,
+    ) -> None:
+        self._tokenizer = MarkupTokenizer(auto_close)
+        self._callback = callback
+        self._builder = TreeBuilder(self._tokenizer.lines) if callback is None else None
+
+    def _dispatch(self, events: Iterator[ParseEvent]):
+        handle = self._callback or self._builder.handle
+        for event in events:
+            handle(event)
+
+    def feed(self, chunk: str):
+        """Parse the next chunk of source."""
+        self._tokenizer.push(chunk)
+        self._dispatch(self._tokenizer.tokenize())
+
+    def close(self) -> AST | None:
+        """Parse the rest of the source and return the resulting AST. Returns `None`
+        if the parser was created with a callback.
+        """
+        self._dispatch(self._tokenizer.close())
+        if self._builder is not None:
+            return self._builder.root
+        return None
+
+
+def iter_events(
+    source: str | Iterable[str],
+    auto_close: bool = True,
+) -> Iterator[ParseEvent]:
+    """Yield the parse events for a source string or for chunks of source without
+    building a tree.
+    """
+    if isinstance(source, str):
+        source = [source]
+
+    tokenizer = MarkupTokenizer(auto_close)
+    for chunk in source:
+        tokenizer.push(chunk)
+        yield from tokenizer.tokenize()
+    yield from tokenizer.close()
+
+
+class ParseState:
+    """State of a single call to `HypertextMarkupParser.parse` with the `regex` engine. Created
+    per call so one parser can be used by multiple threads at once and a failed parse does not
+    affect the next one.
+    """
+
+    def __init__(self) -> None:
+        self.tag_stack: list[str] = []
+        """Current stack of tags in order of when they are opened."""
+        self.in_pre: int = 0
+        """Number of currently open pre elements."""
+
+
 class HypertextMarkupParser:
-    """Parse html/xml like source code strings."""
+    """Parse html/xml like source code strings.
+
+    Two engines are available. The `cursor` engine (default) walks the source once with a
+    moving offset. Its nodes only store their source offsets and resolve line and column numbers
+    from a shared table of line starts when their position is requested.
+    The `regex` engine is the original implementation that re-slices the remaining source after
+    every tag. Both produce the same trees.
+
+    If a `ParseCache` is given, parsing the same source with the same options returns a fresh
+    copy of the cached AST instead of parsing it again.
+    """
 
-    tag_stack = []
-    """Current stack of tags in order of when they are opened."""
-    in_pre: int = 0
-    """Whether the current element context is inside a pre element."""
+    def __init__(
+        self,
+        engine: ParserEngine = "cursor",
+        cache: ParseCache | None = None,
+    ) -> None:
+        if engine not in ["cursor", "regex"]:
+            raise ValueError(f"Unknown parser engine {engine!r}. Expected 'cursor' or 'regex'")
+        self.engine = engine
+        self.cache = cache
 
     def __calc_line_col(self, source: str, start: int) -> tuple[int, int]:
         """Calculate the number of lines and columns that lead to the starting point int he source
@@ -99,10 +526,10 @@ class HypertextMarkupParser:
         """
         return num_cols if num_lines != 0 else init_cols + num_cols
 
-    def __parse_text(self, text: str, pos: Position) -> Literal | None:
+    def __parse_text(self, text: str, pos: Position, state: ParseState) -> Literal | None:
         """Parse the comments and general text found in the provided source."""
 
-        if len(text) > 0 and strip(text, self.tag_stack) != "":
+        if len(text) > 0 and strip(text, state.tag_stack) != "":
             line, col = self.__calc_line_col(text, len(text))
             pos.start.line += line
             pos.start.column = col
@@ -111,41 +538,14 @@ class HypertextMarkupParser:
             pos.end.column = self.__calc_col(line, col, pos.end.column)
             return Literal(
                 LiteralType.Text,
-                strip(text, self.tag_stack),
+                strip(text, state.tag_stack),
                 position=Position.from_pos(pos),
-                in_pre=self.in_pre > 0,
+                in_pre=state.in_pre > 0,
             )
 
         return None
 
-    def __parse_attributes(self, attrs: str) -> dict[str, Attribute]:
-        """Parse a tags attributes from the text found between the tag start and the tag end.
-
-        Example:
-            `<name (attributes)>`
-        """
-        attributes = {}
-        for attr in RE.attribute.finditer(attrs):
-            (name, value, _, double, single, no_bracket) = itemgetter(
-                "name",
-                "value",
-                "curly",
-                "double",
-                "single",
-                "open",
-            )(attr.groupdict())
-
-            value = double or single or no_bracket
-
-            if value in ["yes", "true", None]:
-                value = True
-            elif value in ["no", "false"]:
-                value = False
-
-            attributes[name] = value
-        return attributes
-
-    def __parse_tag(self, source, position: Position):
+    def __parse_tag(self, source, position: Position, state: ParseState):
         """Parse a tag from the given source. This includes the tag start, attributes and tag end.
         It will also parse any comments and text from the start of the source to the start of the
         tag.
@@ -155,7 +555,7 @@ class HypertextMarkupParser:
 
         elem = None
         if begin[0] > 0:
-            elem = self.__parse_text(source[: begin[0]], position)
+            elem = self.__parse_text(source[: begin[0]], position, state)
 
         position.end.column = position.start.column + len(begin[1])
         source = source[begin[0] + len(begin[1]) :]
@@ -181,7 +581,7 @@ class HypertextMarkupParser:
                 raise Exception(
                     f"Closing tag {begin[1]!r} was not closed, maybe it is missing a '>' symbol"
                 )
-            attributes = self.__parse_attributes(source[: end[0]])
+            attributes = parse_attributes(source[: end[0]])
 
         line, col = self.__calc_line_col(source, end[0] + len(end[1]))
         position.end.line = position.start.line + line
@@ -206,12 +606,43 @@ class HypertextMarkupParser:
             AST: A phml AST representing the parsed code source.
         """
 
-        self.tag_stack = []
+        if self.cache is not None:
+            key = self.cache.key(source, self.engine, auto_close)
+            if (ast := self.cache.get(key)) is not None:
+                return ast
+
+        if self.engine == "regex":
+            ast = self.__parse_regex(source, auto_close)
+        else:
+            ast = self.__parse_cursor(source, auto_close)
+
+        if self.cache is not None:
+            self.cache.set(key, ast)
+        return ast
+
+    def __parse_cursor(self, source: str, auto_close: bool) -> AST:
+        """Parse the source in a single pass. The source is never sliced to find the next token,
+        instead the regex patterns are matched from the current offset.
+        """
+
+        tokenizer = MarkupTokenizer(auto_close)
+        tokenizer.push(source)
+        builder = TreeBuilder(tokenizer.lines)
+        for event in tokenizer.close():
+            builder.handle(event)
+        return builder.root
+
+    def __parse_regex(self, source: str, auto_close: bool) -> AST:
+        """Parse the source by repeatedly searching for the next tag and slicing off the
+        consumed part of the source.
+        """
+
+        state = ParseState()
         current = AST()
         position = Position((0, 0), (0, 0))
 
         while RE.tag_start.search(source) is not None and current is not None:
-            source, begin, attr, end, elem = self.__parse_tag(source, position)
+            source, begin, attr, end, elem = self.__parse_tag(source, position, state)
 
             if elem is not None:
                 current.append(elem)
@@ -222,25 +653,24 @@ class HypertextMarkupParser:
                         LiteralType.Comment,
                         str(attr["data"]),
                         position=Position.from_pos(position),
-                        in_pre=self.in_pre > 0,
+                        in_pre=state.in_pre > 0,
                     ),
                 )
             else:
                 name = begin[2]["name"] or ""
                 if begin[2]["opening"] == "/":
-                    if len(self.tag_stack) == 0:
+                    if len(state.tag_stack) == 0:
                         raise Exception(
                             f"Unbalanced tags: Tag was closed without first being opened at {position}",
                         )
-                    elif name != self.tag_stack[-1]:
-                        print("Tag Stack", self.tag_stack)
+                    elif name != state.tag_stack[-1]:
                         raise Exception(
-                            f"Unbalanced tags: {name!r} | {self.tag_stack[-1]!r} at {position}",
+                            f"Unbalanced tags: {name!r} | {state.tag_stack[-1]!r} at {position}",
                         )
 
-                    ptag = self.tag_stack.pop()
+                    ptag = state.tag_stack.pop()
                     if ptag == "pre":
-                        self.in_pre -= 1
+                        state.in_pre -= 1
 
                     if current.position is not None:
                         current.position.end.line = position.end.line
@@ -260,34 +690,44 @@ class HypertextMarkupParser:
                     and not self.is_self_closing(name, auto_close)
                     and begin[2]["opening"] is None
                 ):
-                    self.tag_stack.append(name)
+                    state.tag_stack.append(name)
                     if name == "pre":
-                        self.in_pre += 1
+                        state.in_pre += 1
                     current.append(
                         Element(
                             name,
                             attr,
                             [],
                             position=Position.from_pos(position),
-                            in_pre=self.in_pre > 0,
+                            in_pre=state.in_pre > 0,
                         ),
                     )
                     if len(current) > 0:
                         current = current[-1]
+
+                    if name in raw_text:
+                        close = source.find(f"</{name}")
+                        if close == -1:
+                            close = len(source)
+                        position.start = Point(position.end.line, position.end.column)
+                        elem = self.__parse_text(source[:close], position, state)
+                        if elem is not None:
+                            current.append(elem)
+                        source = source[close:]
                 else:
                     current.append(
                         Element(
                             name,
                             attr,
                             position=deepcopy(position),
-                            in_pre=self.in_pre > 0,
+                            in_pre=state.in_pre > 0,
                         ),
                     )
 
             position.start = Point(position.end.line, position.end.column)
 
         if len(source) > 0:
-            elem = self.__parse_text(source, position)
+            elem = self.__parse_text(source, position, state)
             if (
                 current is not None
                 and isinstance(current, Parent)
@@ -296,8 +736,8 @@ class HypertextMarkupParser:
             ):
                 current.append(elem)
 
-        if len(self.tag_stack) > 0:
+        if len(state.tag_stack) > 0:
             raise Exception(
-                f"The following tags where expected to be closed: {', '.join(repr(tag) for tag in self.tag_stack)}",
+                f"The following tags where expected to be closed: {', '.join(repr(tag) for tag in state.tag_stack)}",
             )
         return current
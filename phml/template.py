@@ -0,0 +1,128 @@
+"""Compiled templates that are created once and rendered many times."""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from .assets import AssetBundle
+from .compiler import HypertextMarkupCompiler, Pipeline
+from .compiler.steps.base import scan_document
+from .components import ComponentManager, ComponentType
+from .embedded import Embedded, ImportRegistry
+from .nodes import AST
+
+if TYPE_CHECKING:
+    from _typeshed import SupportsWrite
+
+__all__ = ["CompiledTemplate"]
+
+
+class CompiledTemplate:
+    """A phml AST bound to the components, global context, compile steps, and imports it is
+    rendered with.
+
+    The AST, components, and context are copied when the template is created so later changes
+    to the manager do not change the template. The `<python>` elements are executed once when
+    the template is created, not on every render. Templates can be shared between threads and
+    pickled to send to other processes.
+
+    Note:
+        The context values and compile steps must be picklable to pickle the template. Modules
+        added with `HypertextManager.add_module` are not pickled and can not be imported by the
+        unpickled template.
+    """
+
+    __slots__ = (
+        "_ast",
+        "_python",
+        "_components",
+        "_context",
+        "_path",
+        "_pipeline",
+        "_imports",
+        "_assets",
+        "_embedded",
+        "_compiler",
+    )
+
+    def __init__(
+        self,
+        ast: AST,
+        components: ComponentManager | dict[str, ComponentType],
+        context: dict[str, Any] | None = None,
+        path: str | Path | None = None,
+        pipeline: Pipeline | None = None,
+        imports: ImportRegistry | None = None,
+        assets: AssetBundle | None = None,
+    ) -> None:
+        ast = ast.clone()
+        self._python = HypertextMarkupCompiler()._get_python_elements(ast)
+        self._ast = ast
+        self._context = dict(context or {})
+        self._path = path
+        self._pipeline = pipeline or Pipeline.default()
+        self._assets = assets
+
+        if isinstance(components, ComponentManager):
+            if assets is None:
+                self._assets = components.assets
+            # Components added with `add_directory` are parsed if the ast uses them
+            scan_document(ast, components)
+            components = dict(components.components)
+        self._setup({key: {**value} for key, value in components.items()}, imports)
+
+    def _setup(self, components: dict[str, ComponentType], imports: ImportRegistry | None):
+        self._imports = imports or ImportRegistry()
+        self._components = ComponentManager(imports=self._imports)
+        self._components.components = components
+        self._components.assets = self._assets
+
+        embedded = Embedded("")
+        for p_elem in self._python:
+            embedded += Embedded(p_elem, registry=self._imports)
+        self._embedded = embedded.context
+
+        self._compiler = HypertextMarkupCompiler(self._pipeline, self._imports)
+
+    def __getstate__(self) -> tuple:
+        return (
+            self._ast,
+            self._python,
+            self._components.components,
+            self._context,
+            self._path,
+            self._pipeline,
+            self._assets,
+        )
+
+    def __setstate__(self, state: tuple):
+        (
+            self._ast,
+            self._python,
+            components,
+            self._context,
+            self._path,
+            self._pipeline,
+            self._assets,
+        ) = state
+        self._setup(components, None)
+
+    @property
+    def ast(self) -> AST:
+        """A copy of the templates AST without the `<python>` elements."""
+        return self._ast.clone()
+
+    def compile(self, **context: Any) -> AST:
+        """Compile the template with the given context and return the resulting ast."""
+        context = {**self._context, **context, "_phml_path_": self._path, **self._embedded}
+        return self._compiler.compile(self._ast, self._components, **context)
+
+    def render(self, _compress: bool = False, **context: Any) -> str:
+        """Render the template with the given context. The context is added to the global
+        context the template was created with.
+        """
+        return self._compiler.render(self.compile(**context), _compress)
+
+    def render_to(self, file: SupportsWrite[str], _compress: bool = False, **context: Any):
+        """Render the template and write it to a file like object in chunks."""
+        self._compiler.render_to(file, self.compile(**context), _compress)
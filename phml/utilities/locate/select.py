@@ -352,7 +352,7 @@ def is_equal(rule: dict, node: Node) -> bool:
     # Validate all attributes
     if len(rule["attributes"]) > 0:
         return all(
-            attr["name"] in node.attributes and __validate_attr(attr, node)
+            attr["name"] in node and __validate_attr(attr, node)
             for attr in rule["attributes"]
         )
 
@@ -0,0 +1,52 @@
+"""
+Compare how the `cursor` and `regex` parser engines scale with the size of the source.
+
+The `regex` engine re-slices the remaining source and recounts lines after every tag, so its
+time per KB grows with the size of the file. The `cursor` engine should stay roughly constant
+per KB, i.e. scale linearly.
+
+Run with `python playground/parser_benchmark.py`.
+"""
+from time import perf_counter
+
+from phml.parser import HypertextMarkupParser
+
+block = """\
+<section class="card" data-index="{index}">
+    <h2>Heading {index}</h2>
+    <!-- comment {index} -->
+    <p :hidden="index > 10">Some text for item {index}</p>
+    <input type="text" value="{{{{ value }}}}">
+    <ul>
+        <For :each="item in items">
+            <li>{{{{ item }}}}</li>
+        </For>
+    </ul>
+</section>
+"""
+
+
+def build_source(blocks: int) -> str:
+    return "<html>\n<body>\n" + "".join(block.format(index=i) for i in range(blocks)) + "</body>\n</html>"
+
+
+def bench(engine: str, source: str, repeat: int = 3) -> float:
+    parser = HypertextMarkupParser(engine)
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        parser.parse(source)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    print(f"{'size (KB)':>10} {'cursor (ms)':>12} {'ms/KB':>8} {'regex (ms)':>12} {'ms/KB':>8}")
+    for blocks in [50, 100, 200, 400, 800]:
+        source = build_source(blocks)
+        size = len(source) / 1024
+        cursor = bench("cursor", source) * 1000
+        regex = bench("regex", source) * 1000
+        print(
+            f"{size:>10.1f} {cursor:>12.2f} {cursor / size:>8.3f} {regex:>12.2f} {regex / size:>8.3f}"
+        )
@@ -0,0 +1,64 @@
+import os
+import pickle
+import stat
+from pathlib import Path
+
+from pytest import raises
+
+from phml import HypertextManager
+from phml.assets import AssetBundle, minify_css
+
+
+def construct(assets: AssetBundle) -> HypertextManager:
+    phml = HypertextManager()
+    phml.assets = assets
+    phml.add(name="Mark", data="<b>!</b><style>b { color: red; }</style><script>mark()</script>")
+    phml.add(name="Card", data="<div>Card</div><style>div { margin: 0; }</style>")
+    return phml
+
+
+def test_minify_css():
+    css = """\
+/* comment */
+a ,  b > i {
+  content: "  {;}  ";
+}
+"""
+    assert minify_css(css) == 'a,b > i{content: "  {;}  ";}'
+
+
+def test_per_component(tmp_path: Path):
+    phml = construct(AssetBundle(tmp_path, url="/static"))
+    first = phml.parse("<html><head></head><body><Mark /><Card /></body></html>").render(True)
+    second = phml.parse("<Card />").render(True)
+
+    assert "<style>" not in first and '<link rel="stylesheet" href="/static/mark.' in first
+    assert '<script src="/static/mark.' in first
+    assert second.count("<link") == 1 and "card." in second
+    assert len(list(tmp_path.iterdir())) == 3, "Expected a file for each component and the same file to be reused"
+
+
+def test_per_page(tmp_path: Path):
+    phml = construct(AssetBundle(tmp_path, per="page"))
+    first = phml.parse("<Mark /><Card />").render()
+    second = phml.parse("<Card /><Mark />").render()
+
+    assert first.count("<link") == 1 and "/assets/components." in first
+    assert first.split("\n")[-8:] == second.split("\n")[-8:], "Expected the same components to share files"
+    assert len(list(tmp_path.iterdir())) == 2
+
+    template = pickle.loads(pickle.dumps(phml.template()))
+    assert "/assets/components." in template.render()
+
+    with raises(ValueError, match="Expected per to be 'component' or 'page' but was 'site'"):
+        AssetBundle(tmp_path, per="site")
+
+
+def test_file_mode(tmp_path: Path):
+    umask = os.umask(0o022)
+    try:
+        AssetBundle(tmp_path).write("card", "div{}", "css")
+    finally:
+        os.umask(umask)
+    (file,) = tmp_path.iterdir()
+    assert stat.S_IMODE(file.stat().st_mode) == 0o644, "Expected files to be readable by the server"
@@ -0,0 +1,84 @@
+import os
+import stat
+from pathlib import Path
+
+from data import *
+from pytest import raises
+
+from phml.cache import LRUCache, ParseCache
+from phml.nodes import Element
+from phml.parser import HypertextMarkupParser
+
+
+class TestLRUCache:
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1
+        cache.set("c", 3)
+
+        assert "b" not in cache, "Expected the least recently used entry to be evicted"
+        assert "a" in cache and "c" in cache
+        assert cache.get("b") is None
+        assert cache.info == (1, 1, 2, 2)
+
+        cache.clear()
+        assert cache.info == (0, 0, 0, 2)
+
+    def test_maxsize(self):
+        cache = LRUCache(0)
+        cache.set("a", 1)
+        assert len(cache) == 0
+
+        with raises(ValueError, match="Cache maxsize must be >= 0 but was .+"):
+            LRUCache(-1)
+
+
+class TestParseCache:
+    def test_key(self):
+        assert ParseCache.key("<div/>", "cursor", True) == ParseCache.key("<div/>", "cursor", True)
+        assert ParseCache.key("<div/>", "cursor", True) != ParseCache.key("<div/>", "cursor", False)
+        assert ParseCache.key("<div/>", "cursor", True) != ParseCache.key("<p/>", "cursor", True)
+
+    def test_fresh_copy(self):
+        parser = HypertextMarkupParser(cache=ParseCache())
+        first = parser.parse(phml_file)
+        first.append(Element("extra"))
+        first[1][0]["lang"] = "en"
+        first[1][0][1].children.clear()
+
+        second = parser.parse(phml_file)
+        assert second == phml_ast, "Expected changes to a parsed AST to not change the cache"
+        assert second is not parser.parse(phml_file)
+        assert parser.cache.info.hits == 2
+
+    def test_directory(self, tmp_path: Path, monkeypatch):
+        HypertextMarkupParser(cache=ParseCache(directory=tmp_path)).parse(phml_file)
+        assert len(list(tmp_path.glob("*.ast"))) == 1
+
+        def no_parse(*_):
+            raise AssertionError("Expected the AST to be loaded from the directory")
+
+        monkeypatch.setattr(HypertextMarkupParser, "_HypertextMarkupParser__parse_cursor", no_parse)
+        parser = HypertextMarkupParser(cache=ParseCache(directory=tmp_path))
+        assert parser.parse(phml_file) == phml_ast
+        assert parser.parse(phml_file) == phml_ast
+        assert parser.cache.info.hits == 2, "Expected entries loaded from the directory to be hits"
+
+    def test_directory_files(self, tmp_path: Path, monkeypatch):
+        umask = os.umask(0o022)
+        try:
+            HypertextMarkupParser(cache=ParseCache(directory=tmp_path)).parse("<div/>")
+        finally:
+            os.umask(umask)
+        (file,) = tmp_path.iterdir()
+        assert stat.S_IMODE(file.stat().st_mode) == 0o644, "Expected entries to be readable by others"
+
+        def fail(*_):
+            raise OSError("Disk full")
+
+        monkeypatch.setattr(os, "replace", fail)
+        with raises(OSError, match="Disk full"):
+            HypertextMarkupParser(cache=ParseCache(directory=tmp_path)).parse("<p/>")
+        assert list(tmp_path.iterdir()) == [file], "Expected the temporary file to be removed"
@@ -1,10 +1,15 @@
+from io import StringIO
+from itertools import count
+
 from data import *
 from pytest import raises
 
 from phml.compiler import (__SETUP__, HypertextMarkupCompiler, add_step,
-                           setup_step)
+                           remove_step, scoped_step, setup_step)
+from phml.compiler.steps.components import STYLE_CACHE, scope_style, scope_styles
+from phml.compiler.steps.loops import LazyLoop
 from phml.components import ComponentManager
-from phml.nodes import AST, Element, Literal, LiteralType
+from phml.nodes import AST, EMPTY_DICT, Element, Literal, LiteralType
 from phml.parser import HypertextMarkupParser
 
 components = ComponentManager()
@@ -52,6 +57,65 @@ class TestHyperTextMarkupCompiler:
         result = self.compiler.render(ast, True)
         assert result == html_file_compressed
 
+    def test_iter_render(self):
+        ast = self.compiler.compile(
+            phml_ast, components, message=message, _phml_path_="tests/src/"
+        )
+        chunks = list(self.compiler.iter_render(ast, chunk_size=64))
+        assert len(chunks) > 1 and all(len(chunk) >= 64 for chunk in chunks[:-1])
+        assert "".join(chunks) == html_file
+        assert "".join(self.compiler.iter_render(ast, True)) == html_file_compressed
+
+        file = StringIO()
+        self.compiler.render_to(file, ast, chunk_size=64)
+        assert file.getvalue() == html_file
+
+    def test_lazy_loops(self):
+        ast = HypertextMarkupParser().parse(
+            """\
+<ul>
+  <For each="i in rows">
+    <li @if="i % 2 == 0">{{ i }}</li>
+    <li @else>odd</li>
+  </For>
+  <!-- Comment -->
+  <li @else>{{ _loop_fail_ }}</li>
+</ul>"""
+        )
+
+        for rows in [[1, 2, 3], []]:
+            for compress in [False, True]:
+                eager = self.compiler.compile(ast, components, rows=rows)
+                lazy = self.compiler.compile(ast, components, rows=rows, _lazy_loops=True)
+                assert isinstance(lazy[0][0], LazyLoop), "Expected loop to not be expanded"
+                assert "".join(self.compiler.iter_render(lazy, compress)) == self.compiler.render(eager, compress)
+
+        lazy = self.compiler.compile(ast, components, rows=count(), _lazy_loops=True)
+        assert next(self.compiler.iter_render(lazy, chunk_size=64)).startswith(
+            "<ul>\n  <li>0</li>\n  <li>odd</li>\n  <li>2</li>"
+        ), "Expected an infinite loop to be rendered lazily"
+
+    def test_scopes(self):
+        ast = HypertextMarkupParser().parse(
+            """\
+<For each="item in [1]">
+  <section><For each="item in [2]"><p><span>{{ item }} {{ other }}</span></p></For></section>
+</For>"""
+        )
+        result = self.compiler.render(self.compiler.compile(ast, ComponentManager(), item=0, other=3), True)
+        assert result == "<section><p><span>2 3</span></p></section>", "Expected the nearest scope to be used"
+
+    def test_render_shares_empty(self):
+        ast = self.compiler.compile(
+            HypertextMarkupParser().parse("<div><p>{{ text }}</p><br /></div>"), ComponentManager(), text="text"
+        )
+        assert self.compiler.render(ast, True) == "<div><p>text</p><br/></div>"
+        assert "".join(self.compiler.iter_render(ast, True)) == "<div><p>text</p><br/></div>"
+        div = ast[0]
+        assert all(
+            node._attributes is EMPTY_DICT and node._context is EMPTY_DICT for node in [div, div[0], div[1]]
+        ), "Expected rendering to not allocate attributes or context"
+
     def test_compiler_unknown_renderable(self):
         ast = self.compiler.compile(
             phml_ast, components, message=message, _phml_path_="tests/src/"
@@ -61,6 +125,62 @@ class TestHyperTextMarkupCompiler:
             self.compiler.render(ast)
 
 
+def test_step_dispatch():
+    scopes = {"all": [], "custom": []}
+
+    @scoped_step
+    def step_all(node, *_):
+        scopes["all"].append(node)
+
+    @scoped_step(tags=["Custom"], attributes=["data-"])
+    def step_custom(node, *_):
+        scopes["custom"].append(node)
+
+    ast = HypertextMarkupParser().parse(
+        "<div><Custom /></div><section><p data-id='1' /></section><main><p /></main>"
+    )
+    add_step(step_all, "scoped")
+    add_step(step_custom, "scoped")
+    try:
+        HypertextMarkupCompiler().compile(ast, components)
+    finally:
+        remove_step(step_all, "scoped")
+        remove_step(step_custom, "scoped")
+
+    assert len(scopes["all"]) == 7, "Expected steps without a filter to run for every scope"
+    assert [node.tag for node in scopes["custom"]] == ["div", "section"]
+
+    scopes["custom"].clear()
+    add_step(step_custom, "scoped")
+    try:
+        HypertextMarkupCompiler().compile(HypertextMarkupParser().parse("<main><p /></main>"), components)
+    finally:
+        remove_step(step_custom, "scoped")
+    assert len(scopes["custom"]) == 0, "Expected step to be skipped for the document"
+
+
+def test_scope_style():
+    style = """\
+/* a, b { */
+@media (width > 1px) { a:is(.x, .y), b { color: red; } }
+@keyframes k { from { top: 0; } to { top: 1px; } }
+@import "c;d";
+p[title="{e,f}"] { &:hover { color: blue; } }\
+"""
+    assert scope_style(style, "[s]") == """\
+/* a, b { */
+@media (width > 1px) { [s] a:is(.x, .y), [s] b { color: red; } }
+@keyframes k { from { top: 0; } to { top: 1px; } }
+@import "c;d";
+[s] p[title="{e,f}"] { &:hover { color: blue; } }\
+"""
+
+    STYLE_CACHE.clear()
+    styles = [Element("style", {"scoped": True}, [Literal(LiteralType.Text, "p { }")])]
+    assert scope_styles(styles, "~1") == scope_styles(styles, "~1") == "[data-phml-cmpt-scope='~1'] p { }"
+    assert STYLE_CACHE.info.hits == 1 and STYLE_CACHE.info.misses == 1
+
+
 class TestCompilerStepExceptions:
     compiler = HypertextMarkupCompiler()
     parser = HypertextMarkupParser()
@@ -100,7 +220,7 @@ class TestCompilerStepExceptions:
         ) == AST([Element("p", children=[Literal(LiteralType.Text, "No Iterations")])])
 
         ast = self.compiler.compile(has_exception, components)
-        assert len(ast) == 3 and isinstance(ast[0], Element) and ast[0].tag == "p"
+        assert len(ast) == 1 and isinstance(ast[0], Element) and ast[0].tag == "p"
 
     def test_step_component_slot_multiple_exception(self):
         components["Sub.Component"]["elements"].append(
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from typing import Any
 
@@ -97,6 +98,58 @@ Some root literal
 
         assert "Component" in components
     
+    def test_hash(self):
+        components = ComponentManager()
+        assert components.parse("<p>a</p>")["hash"] == "~9e4e741ad94ff44a", "Expected hashes to be the same in every process"
+        assert components.parse("<p>b</p>")["hash"] != "~9e4e741ad94ff44a"
+
+    def test_template(self):
+        components = ComponentManager()
+        components.add(
+            name="Card",
+            data='<div><h2>{{ title }}</h2><ul><li> a </li></ul><Slot /><footer><Slot name="end" /></footer></div>',
+        )
+        template = components["Card"]["template"]
+        assert template.slot == (0, 2) and template.named == {"end": (0, 3, 0)}
+
+        static = components["Card"]["elements"][0][1]
+        assert isinstance(static, StaticElement) and static.tags == {"li"}
+        assert not isinstance(components["Card"]["elements"][0][0], StaticElement)
+
+        with raises(ValueError, match="Can not have more that one catch all slot in a component"):
+            components.add(name="Invalid", data="<Slot /><p><Slot /></p>")
+
+    def test_add_directory(self, tmp_path: Path):
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "card.phml").write_text("<div>Card</div>")
+        (tmp_path / "sub" / "nav_bar.phml").write_text("<nav />")
+
+        components = ComponentManager()
+        components.add_directory(tmp_path)
+        assert "Card" in components and "Sub.NavBar" in components
+        assert len(components.components) == 0, "Expected components to be parsed when used"
+
+        assert components["Card"]["elements"][0][0].content == "Card"
+        assert list(components.components) == ["Card"]
+
+        tracker = components.track()
+        assert tracker["Card"] is components["Card"]
+        (tmp_path / "card.phml").write_text("<div>Changed</div>")
+        os.utime(tmp_path / "card.phml", ns=(0, 10**9))
+        assert tracker["Card"]["elements"][0][0].content == "Card", "Expected files to be checked once per compile"
+        assert components["Card"]["elements"][0][0].content == "Changed"
+
+        components.remove("Sub.NavBar")
+        assert "Sub.NavBar" not in components
+
+        (tmp_path / "card.phml").unlink()
+        with raises(KeyError, match="Card is not a known component, its file .+card.phml' was removed"):
+            components["Card"]
+        assert "Card" not in components and len(components.components) == 0
+
+        with raises(ValueError, match="Expected path to be a directory but was '.+card.phml'"):
+            components.add_directory(tmp_path / "card.phml")
+
     def test_remove(self):
         components = ComponentManager()
         components.add("tests/src/component.phml", ignore="tests/src/")
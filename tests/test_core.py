@@ -1,3 +1,5 @@
+import pickle
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from data import *
@@ -52,6 +54,29 @@ class TestManager:
     
         assert out.read_text() == html_file
 
+    def test_stream(self):
+        loops = '<ul><For each="x in items"><li>{{{{ x }}}}</li></For>{}</ul><p><For each="x in items">item</For>{}</p>'
+        for fallbacks in [("", ""), ("<li @else>none</li>", "<b @else>none</b>")]:
+            phml = HypertextManager().parse(loops.format(*fallbacks))
+            for items in [[], [1], [1, 2]]:
+                for compress in [False, True]:
+                    expected = phml.render(compress, items=items)
+                    assert "".join(phml.stream(compress, items=items)) == expected, (
+                        f"Expected stream to match render for {len(items)} items"
+                    )
+
+        phml = HypertextManager().parse('<p><For each="x in items">item</For></p>')
+        assert "".join(phml.stream(items=[])) == "<p/>", "Expected empty loops to self close their parent"
+        assert "".join(phml.stream(items=[1])) == "<p>item</p>", "Expected a single text child to be inline"
+
+        contexts = []
+        phml.add_step(lambda _node, _components, context: contexts.append(dict(context)), "scoped")
+        "".join(phml.stream(items=[1]))
+        assert len(contexts) > 0 and all(
+            not any(key.startswith("_phml_lazy") or key == "_lazy_loops" for key in context)
+            for context in contexts
+        ), "Expected lazy loops to not be a part of the context"
+
     def test_open(self, tmp_path: Path):
         out = tmp_path / "index.html"
         compressed_out = tmp_path / "index-compress.html"
@@ -72,11 +97,47 @@ class TestManager:
     
         assert compressed_out.read_text() == html_file_compressed
 
+    def test_concurrent_render(self):
+        phml = construct_base().load("tests/src/index.phml")
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(
+                pool.map(
+                    lambda _: phml.render(message=message, _phml_path_="tests/src/"),
+                    range(64),
+                )
+            )
+        assert all(result == html_file for result in results)
+
     def test_render_exceptions(self):
         with raises(ValueError, match="Must first parse a phml file before rendering a phml AST"):
             HypertextManager().render(_phml_path_="tests/src/")
 
 
+    def test_template(self):
+        phml = construct_base().load("tests/src/index.phml")
+        template = phml.template()
+        phml.remove("Component")
+
+        assert template.render(message=message) == html_file, "Expected template to not change with the manager"
+        assert template.render(True, message=message) == html_file_compressed
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: template.render(message=message), range(32)))
+        assert all(result == html_file for result in results)
+
+        assert pickle.loads(pickle.dumps(template)).render(message=message) == html_file
+
+    def test_template_python(self):
+        phml = HypertextManager().parse(
+            "<python>\nrenders = []\n</python><p>{{ renders.append(1) or len(renders) }}</p>"
+        )
+        template = phml.template()
+        assert template.render() == "<p>1</p>"
+        assert template.render() == "<p>2</p>", "Expected python elements to be executed once"
+
+        with raises(ValueError, match="Must first parse a phml file before creating a template"):
+            HypertextManager().template()
+
     def test_format(self, tmp_path: Path):
         file = tmp_path / "index.html"
         file.write_text(html_file, encoding="utf-8")
@@ -128,6 +189,75 @@ class TestManager:
         phml.remove_module(".phml.builder")
         assert ".phml.builder" not in phml.from_imports
 
+    def test_module_isolation(self):
+        code = "<python>from .fractions import Fraction</python><p>{{ Fraction(1, 2) }}</p>"
+        phml = HypertextManager().parse(code)
+        other = HypertextManager()
+        phml.add_module("fractions", imports=["Fraction"])
+
+        assert phml.render() == "<p>1/2</p>"
+        assert ".fractions" not in other.from_imports, "Expected modules to be added per manager"
+
+    def test_pure_components(self):
+        icon = '<python>Props = {"name": ""}</python><i :class="name"><Mark /></i>'
+        page = '<Icon name="a" /><Icon name="a" /><p><Icon name="b" /></p><Icon name="a">Child</Icon>'
+
+        def construct(pure: bool) -> HypertextManager:
+            phml = HypertextManager().parse(page)
+            phml.add(name="Mark", data="<b>!</b><style>b { color: red; }</style>")
+            phml.add(name="Icon", data=icon.replace("</python>", f"\nPure = {pure}</python>"))
+            return phml
+
+        phml = construct(True)
+        assert phml.render() == construct(False).render(), "Expected pure components to render the same"
+        assert phml.memo_info.hits == 1 and phml.memo_info.misses == 2
+        assert phml.render() == construct(False).render()
+        assert phml.memo_info.hits == 4, "Expected the cache to be reused between renders"
+
+        phml.add(name="Mark", data="<u>?</u>")
+        assert "<u>?</u>" in phml.render() and phml.memo_info.hits == 1, "Expected changed components to clear the cache"
+
+    def test_component_usage(self):
+        phml = HypertextManager()
+        phml.add(name="Mark", data="<b>!</b><style>b { color: red; }</style>")
+        phml.add(name="Card", data="<div><Mark /></div><script>card()</script>")
+
+        assert "card()" in phml.parse("<Card />").render()
+        assert "<style>" not in phml.parse("<p>Plain</p>").render(), "Expected styles to only be added for used components"
+        assert len(phml.parse("<p>Plain</p>").compile()) == 1
+
+        looped = phml.parse('<For each="i in range(2)"><Card /></For>').render()
+        assert "card()" in looped and "color: red" in looped, "Expected components used in loops to be added"
+
+    def test_removed_component_file(self, tmp_path: Path):
+        (tmp_path / "card.phml").write_text("<div>Card</div>")
+        phml = HypertextManager().add_directory(tmp_path).parse("<Card />")
+        assert "<div>Card</div>" in phml.render()
+
+        (tmp_path / "card.phml").unlink()
+        assert phml.render() == "<Card/>", "Expected removed components to no longer be used"
+
+    def test_steps(self):
+        scopes = []
+
+        def step_collect(node, *_):
+            scopes.append(node)
+
+        phml = HypertextManager().parse("<div />")
+        pipeline = phml.pipeline
+        phml.add_step(step_collect, "scoped")
+        assert step_collect not in pipeline.scoped, "Expected pipelines to be immutable"
+
+        HypertextManager().parse("<div />").render()
+        assert len(scopes) == 0, "Expected steps to be added per manager"
+        phml.render()
+        assert len(scopes) == 2
+
+        phml.remove_step(step_collect, "scoped")
+        assert phml.pipeline == pipeline
+        with raises(ValueError, match="Expected stage to be 'setup', 'scoped', or 'post' but was 'other'"):
+            phml.add_step(step_collect, "other")
+
     def test_expose(self):
         phml = construct_base().load("tests/src/index.phml")
         phml.expose({"data": None}, message=message)
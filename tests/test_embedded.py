@@ -1,5 +1,6 @@
 # Imports used for assert
 import time
+from collections import ChainMap
 from re import match, sub
 from time import sleep
 
@@ -71,6 +72,32 @@ message = True
         assert exec_embedded(early_return)
         assert exec_embedded(final_assignment)
 
+    def test_code_cache(self):
+        CODE_CACHE.clear()
+        assert exec_embedded("value * 2", value=2) == 4
+        assert exec_embedded("value * 2", value=3) == 6, "Expected cached code to use the new context"
+        assert exec_embedded("missing") is None, "Expected unknown names to be None"
+        assert CODE_CACHE.info.hits == 1 and CODE_CACHE.info.misses == 2
+
+        with raises(EmbeddedPythonException):
+            exec_embedded("value = ")
+        assert "value = " not in CODE_CACHE, "Expected invalid code to not be cached"
+
+    def test_scope(self):
+        scope = ChainMap({"value": 2}, {"value": 1, "other": 3})
+        assert exec_embedded("value * other", None, scope) == 6
+        assert exec_embedded("value * other", None, scope, other=4) == 8, "Expected context to override the scope"
+        assert exec_embedded_blocks("{{ value }}", "", scope) == "2"
+
+    def test_namespace(self):
+        namespace = Namespace({"items": [1, 2], "limit": 1})
+        assert exec_embedded("[i for i in items if i > limit]", None, namespace) == [2]
+        assert set(namespace) == {"items", "limit", "__builtins__"}, "Expected names to be resolved when used"
+
+        assert exec_embedded("value = len(items)", None, namespace) == 2
+        assert exec_embedded("value", None, namespace) is None, "Expected locals to not be retained"
+        assert exec_embedded("items", None, Namespace(namespace, items=[3])) == [3]
+
     def test_blocks(self):
         bracket_in_block = """{{ {'result': True} }}"""
         assert exec_embedded_blocks(bracket_in_block) == "{'result': True}"
@@ -1,7 +1,10 @@
+import pickle
+from copy import deepcopy
+
 from pytest import raises
 
-from phml.nodes import (AST, Element, Literal, LiteralType, Node, NodeType,
-                        Parent, Point, Position)
+from phml.nodes import (AST, EMPTY_DICT, Element, LineIndex, Literal,
+                        LiteralType, Node, NodeType, Parent, Point, Position)
 
 
 def test_point():
@@ -35,6 +38,17 @@ class TestNode:
         assert node.type == NodeType.AST, "Expected node.type to be 'ast'"
         assert node.position == None, "Expected position to be None"
 
+    def test_lazy_position(self):
+        lines = LineIndex("<p>\n  text\n</p>")
+        node = Literal(LiteralType.Text, "text")
+        node.set_offsets(lines, 6, 10)
+
+        assert node._position is None, "Expected position to not be built before it is requested"
+        assert node.position == Position((1, 2), (1, 6))
+        assert node.position is node.position, "Expected position to be built once"
+
+        node.position = None
+        assert node.position is None, "Expected assigning position to clear the source offsets"
 
     def test_dict_literal(self):
         literal = Node.from_dict(
@@ -176,7 +190,22 @@ class TestParent:
         )
        
         assert parent.pop(1) == self.literal and len(parent) == 1
-        
+
+    def test_identity(self):
+        first, second, third = self.literal, self.literal, self.literal
+        parent = Parent(NodeType.ELEMENT, [first, second])
+
+        assert parent.index(second) == 1, "Expected equal siblings to be found by identity"
+        parent.append(third)
+        assert parent.index(third) == 2
+
+        parent.remove(second)
+        assert parent[:] == [first, third] and parent[1] is third, "Expected the given node to be removed"
+        assert parent.index(third) == 1, "Expected index to be correct after removing a child"
+
+        parent.children.insert(0, second)
+        assert parent.index(third) == 2, "Expected index to be correct after changing the children directly"
+
     def test_set(self):
         parent = Parent(NodeType.ELEMENT, [self.node, self.node, self.node])
 
@@ -275,6 +304,62 @@ class TestElement:
         del element["hidden"]
         assert "hidden" not in element
 
+    def test_shared_empty(self):
+        first, second = Element("div"), Element("div")
+        assert first._attributes is EMPTY_DICT and second._context is EMPTY_DICT
+        assert "id" not in first and first.get("id", None) is None
+        assert first._attributes is EMPTY_DICT, "Expected reads to not replace the shared dict"
+
+        first["id"] = "test"
+        first.context.update({"data": 1})
+        assert first.attributes == {"id": "test"} and first.context == {"data": 1}
+        assert second._attributes is EMPTY_DICT and second._context is EMPTY_DICT
+
+        with raises(TypeError, match="EmptyDict can not be modified"):
+            EMPTY_DICT["id"] = "test"
+
+        assert deepcopy(second)._attributes is EMPTY_DICT
+        assert pickle.loads(pickle.dumps(second))._context is EMPTY_DICT
+
+    def test_slots(self):
+        for node in [Element("div"), Literal(LiteralType.Text, ""), AST(), Point(0, 0), Position((0, 0), (0, 0))]:
+            assert not hasattr(node, "__dict__"), f"Expected {type(node).__name__} to not have a __dict__"
+
+    def test_clone(self):
+        child = Element("p", {"id": "child"}, [Literal(LiteralType.Text, "text")])
+        element = Element("div", {"class": "parent"}, [child, Element("br")])
+        element.context["value"] = 1
+        ast = AST([element])
+
+        for lazy in [False, True]:
+            clone = ast.clone(lazy)
+            assert clone == ast, "Expected clone to equal the original"
+            assert clone[0] is not element and clone[0][0] is not child, "Expected new nodes"
+            assert clone[0].parent is clone and clone[0][0].parent is clone[0], "Expected parents to be the clones"
+            assert clone[0].context == {"value": 1}, "Expected context to be copied"
+            assert clone[0][1]._attributes is EMPTY_DICT, "Expected empty attributes to stay shared"
+
+            clone[0]["class"] = "changed"
+            clone[0][0].append(Literal(LiteralType.Text, "more"))
+            assert element["class"] == "parent" and len(child) == 1, "Expected original to not change"
+
+        assert Element("br", children=None).clone().children is None, "Expected self closing element to stay self closing"
+
+    def test_clone_lazy(self):
+        child = Element("p", children=[Literal(LiteralType.Text, "text")])
+        element = Element("div", children=[child])
+
+        clone = element.clone(lazy=True)
+        assert clone._origin is element and clone._children is None, "Expected children to not be copied"
+
+        # Clones of an uncopied clone copy from the original
+        assert clone.clone(lazy=True)._origin is element
+        assert clone.clone() == element
+
+        assert clone[0] is not child, "Expected children to be copied on access"
+        assert clone._origin is None and clone[0]._origin is child, "Expected grand children to not be copied"
+        assert clone[0] == child
+
 def test_literal():
     literal_text = Literal(LiteralType.Text, "text")
     literal_comment = Literal(LiteralType.Comment, "comment")
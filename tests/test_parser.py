@@ -1,7 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
 from data import *
 from pytest import raises
 
-from phml.parser import HypertextMarkupParser
+from phml.cache import ParseCache
+from phml.nodes import AST, Element, Literal, LiteralType, Position, p_code
+from phml.parser import (EventType, HypertextMarkupParser,
+                         IncrementalMarkupParser, iter_events)
 
 
 class TestHyperTextParser:
@@ -11,6 +17,21 @@ class TestHyperTextParser:
         ast = self.parser.parse(phml_file)
         assert ast == phml_ast, "Invalid parsed AST"
 
+    def test_raw_text(self):
+        ast = self.parser.parse("<script>if (a<b && c>d) { x = '<!-- y -->'; }</script>")
+        assert ast == AST([
+            Element("script", children=[
+                Literal(LiteralType.Text, "if (a<b && c>d) { x = '<!-- y -->'; }")
+            ])
+        ])
+
+        ast = self.parser.parse("<python>\nvalues = [i for i in range(3) if i<2]\n</python><style></style>")
+        assert len(ast[0]) == 1 and ast[0][0].content == "\nvalues = [i for i in range(3) if i<2]\n"
+        assert len(ast[1]) == 0
+
+        with raises(Exception, match="The following tags where expected to be closed: 'style'"):
+            self.parser.parse("<style>div { color: red; }")
+
     def test_parse_tag(self):
         with raises(Exception, match="Comment was not closed"):
             self.parser.parse("<!-- some comment\n<div>Next Element</div>")
@@ -30,3 +51,120 @@ class TestHyperTextParser:
 
         with raises(Exception, match="Unbalanced tags: Tag was closed without first being opened at .+"):
             self.parser.parse("</div>")
+
+
+class TestRegexEngine(TestHyperTextParser):
+    parser = HypertextMarkupParser("regex")
+
+
+def test_engines_match():
+    assert HypertextMarkupParser("cursor").parse(phml_file) == HypertextMarkupParser("regex").parse(phml_file)
+    with raises(ValueError, match="Unknown parser engine .+"):
+        HypertextMarkupParser("unknown")
+
+
+def test_cursor_positions():
+    ast = HypertextMarkupParser("cursor").parse("<div>\n  <p>text</p>\n</div>")
+    div = ast[0]
+    assert div.position == Position((0, 0), (2, 6))
+    assert div[0].position == Position((1, 2), (1, 13))
+    assert div[0][0].position == Position((1, 5), (1, 9))
+
+
+class TestIncrementalParser:
+    def test_feed(self):
+        parser = IncrementalMarkupParser()
+        for i in range(0, len(phml_file), 7):
+            parser.feed(phml_file[i : i + 7])
+        assert parser.close() == phml_ast
+
+    def test_callback(self):
+        events = []
+        parser = IncrementalMarkupParser(callback=events.append)
+        parser.feed("<div class='a'><!-- comment --><p>te")
+        assert [event.type for event in events] == [EventType.START, EventType.COMMENT, EventType.START]
+
+        parser.feed("xt</p><br></div>")
+        assert parser.close() is None
+        assert [(event.type, event.data) for event in events[3:]] == [
+            (EventType.TEXT, "text"),
+            (EventType.END, "p"),
+            (EventType.EMPTY, "br"),
+            (EventType.END, "div"),
+        ]
+
+    def test_iter_events(self):
+        chunks = ["<p>Some <b>bo", "ld</b> text</p>", "<script>a<b</scr", "ipt>"]
+        text = [
+            event.data for event in iter_events(chunks) if event.type == EventType.TEXT
+        ]
+        assert text == ["Some", "bold", "text", "a<b"]
+
+    def test_linear_feed(self):
+        def feed(source: str) -> float:
+            parser = IncrementalMarkupParser()
+            start = perf_counter()
+            for i in range(0, len(source), 1024):
+                parser.feed(source[i : i + 1024])
+            parser.close()
+            return perf_counter() - start
+
+        body = "some text, " * 20_000
+        for template in ["<div>{}</div>", "<script>{}</script>", "<div><!-- {} --></div>"]:
+            small = min(feed(template.format(body)) for _ in range(3))
+            large = min(feed(template.format(body * 4)) for _ in range(3))
+            assert large < small * 8, (
+                f"Expected feeding {template} in chunks to take linear time but was {large / small:.1f}x slower for 4x the source"
+            )
+
+    def test_exceptions(self):
+        parser = IncrementalMarkupParser()
+        parser.feed("<div><!-- comment")
+        with raises(Exception, match="Comment was not closed"):
+            parser.close()
+
+        parser = IncrementalMarkupParser()
+        parser.feed("<div")
+        with raises(Exception, match="Expected tag .+ to be closed with symbol '>'. Was not closed."):
+            parser.close()
+
+        with raises(Exception, match="The following tags where expected to be closed: 'div'"):
+            list(iter_events(["<div>", "text"]))
+
+
+class TestThreadSafety:
+    sources = [
+        phml_file,
+        html_file,
+        "<pre><p>unclosed",
+        "<div><pre>text</pre></div><p>after</p>",
+        "<div></p>",
+    ]
+
+    def parse(self, parser: HypertextMarkupParser, source: str) -> str:
+        try:
+            return p_code(parser.parse(source))
+        except Exception as error:
+            return str(error)
+
+    def test_shared_parser(self):
+        for parser in [
+            HypertextMarkupParser("cursor"),
+            HypertextMarkupParser("regex"),
+            HypertextMarkupParser(cache=ParseCache(maxsize=2)),
+        ]:
+            expected = [self.parse(HypertextMarkupParser(parser.engine), source) for source in self.sources]
+            jobs = [i % len(self.sources) for i in range(2000)]
+
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(lambda i: self.parse(parser, self.sources[i]), jobs))
+
+            assert results == [expected[i] for i in jobs]
+
+    def test_failed_parse(self):
+        parser = HypertextMarkupParser("regex")
+        with raises(Exception, match="The following tags where expected to be closed: .+"):
+            parser.parse("<pre><p>text")
+
+        ast = parser.parse("<p>text</p>")
+        assert not ast[0].in_pre and not ast[0][0].in_pre, "Expected no state from the failed parse"